@@ -1,10 +1,26 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import pandas as pd
 import os
 import json
-import base64
-import importlib 
+import gzip
+import hashlib
+import io
+import multiprocessing
+import sys
+import threading
+import types
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+from PIL import Image
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from artifact_store import (evict, generate_artifact, input_dir, input_paths, is_complete, load_generation_stats,
+                            load_input_stats, output_dir, output_paths, store_input, touch)
+from artifact_store import artifact_key as make_artifact_key
+from gen_animation import (JOB_STAGES, LAYOUT_MODES, assemble_payload, atomic_output, init_job_worker, load_survey,
+                           format_stats, measure_stage)
 
 # ページ設定
 st.set_page_config(page_title="ファイブエムOS 可視化プロト", layout="wide")
@@ -12,68 +28,459 @@ st.set_page_config(page_title="ファイブエムOS 可視化プロト", layout=
 # --- タイトル ---
 st.title("🌌 ファイブエムOS 可視化プロト")
 
+# --- キャッシュ ---
+# 各成果物をファイル内容のハッシュをキーに個別キャッシュし、古くなったものだけ再計算する
+# （セッションごとにデータが違うので、同じ名前でもキーごとに別のエントリーを持つ）
+CACHE_MAX_ENTRIES = 64
+
+
+@st.cache_resource
+def _artifact_store():
+    """Process-wide store shared by all sessions: (artifact name, key) -> value, least recently used first."""
+    return {"lock": threading.Lock(), "entries": OrderedDict()}
+
+
+# 今回の実行でのヒット/ミス（サイドバー表示用）
+cache_run_status = {}
+
+
+def cached_artifact(name, key, compute, track=True, valid=None):
+    """Return the cached value for ``(name, key)``, computing it on a miss.
+
+    ``valid`` can reject a cached value (e.g. one whose files were evicted).
+    Beyond ``CACHE_MAX_ENTRIES`` the least recently used entries are dropped.
+    """
+    store = _artifact_store()
+    with store["lock"]:
+        hit = (name, key) in store["entries"]
+        if hit:
+            value = store["entries"][(name, key)]
+            store["entries"].move_to_end((name, key))
+    if hit and valid is not None and not valid(value):
+        hit = False
+    if not hit:
+        value = compute()
+        with store["lock"]:
+            store["entries"][(name, key)] = value
+            store["entries"].move_to_end((name, key))
+            while len(store["entries"]) > CACHE_MAX_ENTRIES:
+                store["entries"].popitem(last=False)
+    if track:
+        counts = st.session_state.setdefault("cache_stats", {}).setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+        cache_run_status[name] = hit
+    return value
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_key(path):
+    """Content hash of ``path`` (None if missing); rehashed only when mtime or size change."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return cached_artifact(f"hash:{path}", (stat.st_mtime_ns, stat.st_size), lambda: _hash_file(path), track=False)
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# --- 成果物ストア ---
+# 入力CSVと生成物は内容のハッシュで保存し、セッションはそのハッシュだけを持つ
+# （同時にアップロードしても互いに上書きせず、同じ入力と設定なら生成物を共有する）
+
+# 同梱のCSV（アップロードしていないセッションで表示するデータ）
+csv_path = "survey_data.csv"
+
+
+def store_input_file(path):
+    """Store the CSV at ``path``; return the validation error message or None."""
+    try:
+        with open(path, "rb") as f:
+            store_input(f)
+        return None
+    except ValueError as e:
+        return str(e)
+
+
+def asset_path(url):
+    """Local path of a static asset URL from :func:`publish_asset`."""
+    return os.path.join(STATIC_DIR, os.path.basename(url))
+
+
+# 各セッションが表示中の入力・生成物・配信中のアセット（退避の対象から外す）
+@st.cache_resource
+def _session_usage():
+    """Process-wide record shared by all sessions: session id -> paths the session is showing."""
+    return {"lock": threading.Lock(), "sessions": {}}
+
+
+def record_shown(paths):
+    """Remember ``paths`` as what this session shows, until its next run records again."""
+    ctx = get_script_run_ctx()
+    usage = _session_usage()
+    with usage["lock"]:
+        usage["sessions"][ctx.session_id if ctx is not None else None] = list(paths)
+
+
+def shown_by_sessions():
+    """Paths shown by any live session; records of closed sessions are dropped."""
+    usage = _session_usage()
+    runtime = Runtime.instance() if Runtime.exists() else None
+    with usage["lock"]:
+        if runtime is not None:
+            for session_id in [s for s in usage["sessions"] if not runtime.is_active_session(s)]:
+                del usage["sessions"][session_id]
+        return [path for paths in usage["sessions"].values() for path in paths]
+
+
+def evict_unused():
+    """Apply the store's size limit, keeping running jobs and what any live session shows."""
+    protect = shown_by_sessions()
+    with _generation_jobs()["lock"]:
+        for key, job in _generation_jobs()["jobs"].items():
+            if not job["future"].done():
+                protect += [output_dir(key), input_dir(job["source"])]
+    for key in ("dataset", "artifact"):
+        value = st.session_state.get(key)
+        if value:
+            source = value if key == "dataset" else value[1]
+            protect.append(input_dir(source))
+            if key == "artifact":
+                protect.append(output_dir(value[0]))
+    evict(protect=protect, extra_dirs=[STATIC_DIR])
+
+
+# --- バックグラウンド生成ジョブ ---
+# 生成は別プロセスで実行し、完了するまで既存の成果物を表示し続ける
+# ワーカーが異常終了したとき（メモリ不足で強制終了されたなど）の表示
+BROKEN_POOL_ERROR = "生成プロセスが異常終了しました（メモリ不足の可能性があります）"
+
+
+def _start_pool(jobs):
+    ctx = multiprocessing.get_context("spawn")
+    jobs["queue"] = ctx.Queue()
+    jobs["executor"] = ProcessPoolExecutor(max_workers=1, mp_context=ctx,
+                                           initializer=init_job_worker, initargs=(jobs["queue"],))
+
+
+@st.cache_resource
+def _generation_jobs():
+    """Process-wide job state shared by all sessions: artifact key -> job."""
+    jobs = {"lock": threading.Lock(), "jobs": {}}
+    _start_pool(jobs)
+    return jobs
+
+
+def _restart_pool_locked(jobs, broken):
+    """Replace the executor ``broken`` (a worker died) with a new one, unless already replaced."""
+    if jobs["executor"] is not broken:
+        return
+    broken.shutdown(wait=False, cancel_futures=True)
+    _start_pool(jobs)
+
+
+def _submit_locked(jobs, key, source, options):
+    # Streamlitはこのスクリプトを __main__ として実行するため、spawnされたワーカーが
+    # app.py を再実行しないよう、起動の間だけ空の __main__ に差し替える
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        try:
+            future = jobs["executor"].submit(generate_artifact, key, source, options)
+        except BrokenProcessPool:
+            # 前のジョブでワーカーが落ちたプールには投入できないので作り直す
+            _restart_pool_locked(jobs, jobs["executor"])
+            future = jobs["executor"].submit(generate_artifact, key, source, options)
+    finally:
+        sys.modules["__main__"] = main_module
+    jobs["jobs"][key] = {"future": future, "executor": jobs["executor"], "source": source,
+                         "stage": "queued", "error": None}
+
+
+def poll_generation():
+    """Drain progress messages and return ``{artifact key: job snapshot}`` for unfinished or failed jobs."""
+    jobs = _generation_jobs()
+    finished = False
+    with jobs["lock"]:
+        while True:
+            try:
+                key, stage = jobs["queue"].get_nowait()
+            except Empty:
+                break
+            if key in jobs["jobs"] and not jobs["jobs"][key]["future"].done():
+                jobs["jobs"][key]["stage"] = stage
+        for key, job in list(jobs["jobs"].items()):
+            if job["future"].done() and job["stage"] != "error":
+                error = job["future"].exception()
+                finished = True
+                if isinstance(error, BrokenProcessPool):
+                    # このプールは使えなくなったので、以後のジョブ（再生成を含む）は新しいプールで動かす
+                    _restart_pool_locked(jobs, job["executor"])
+                    job["error"] = BROKEN_POOL_ERROR
+                    job["stage"] = "error"
+                elif error:
+                    job["error"] = str(error)
+                    job["stage"] = "error"
+                else:
+                    # 成功したジョブはストアに完了印が付くので、以後はストアを見る
+                    del jobs["jobs"][key]
+        snapshot = {key: {"running": not job["future"].done(), "stage": job["stage"], "error": job["error"]}
+                    for key, job in jobs["jobs"].items()}
+    if finished:
+        evict_unused()
+    return snapshot
+
+
+def request_artifact(key, source, options):
+    """Return True if ``key`` is stored; otherwise make sure it is being generated.
+
+    Requests for the same key from any session share one job. A failed job
+    is kept (and reported) until :func:`retry_artifact` clears it.
+    """
+    if is_complete(output_dir(key)):
+        touch(output_dir(key))
+        return True
+    poll_generation()
+    jobs = _generation_jobs()
+    with jobs["lock"]:
+        if key not in jobs["jobs"]:
+            _submit_locked(jobs, key, source, options)
+    return False
+
+
+def retry_artifact(key):
+    jobs = _generation_jobs()
+    with jobs["lock"]:
+        job = jobs["jobs"].get(key)
+        if job is not None and job["future"].done():
+            del jobs["jobs"][key]
+
+
 # --- サイドバー：データ管理 ---
 st.sidebar.header("🛠 データ管理")
 
 uploaded_file = st.sidebar.file_uploader("新しいデータをアップロード (CSV)", type="csv")
-if uploaded_file is not None:
-    with open("survey_data.csv", "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    st.sidebar.success("データが保存されました！")
-
-# 🔄 【重要】データを強制的に再計算する処理
-if st.sidebar.button("🎥 アニメーションを生成/更新"):
-    with st.spinner('最新データを解析中...'):
-        try:
-            # キャッシュをクリアしてモジュールを再読み込み
-            if "gen_animation" in sys.modules:
-                importlib.reload(sys.modules["gen_animation"])
-            else:
-                import gen_animation
-            
-            st.cache_data.clear() # Streamlitのデータキャッシュを全削除
-            st.sidebar.success("最新データに更新しました！")
-            st.rerun() 
-        except Exception as e:
-            import gen_animation # 初回実行用
-            importlib.reload(gen_animation)
+# アップローダーは再実行のたびに同じファイルを返すので、取り込みはファイルごとに一度だけ
+if uploaded_file is not None and st.session_state.get("ingested_upload") != uploaded_file.file_id:
+    st.session_state["ingested_upload"] = uploaded_file.file_id
+    try:
+        uploaded_file.seek(0)
+        # 検証に通ったときだけストアに入れ、このセッションの表示対象にする
+        st.session_state["dataset"] = store_input(uploaded_file)
+        st.sidebar.success("データが保存されました！")
+        evict_unused()
+    except ValueError as e:
+        st.sidebar.error(f"アップロードしたCSVを取り込めませんでした: {e}")
+
+cache_panel = st.sidebar.empty()
+
+# このセッションのデータ（アップロードがなければ同梱のCSV）
+survey_error = None
+source = st.session_state.get("dataset")
+if source is not None and not is_complete(input_dir(source)):
+    st.sidebar.warning("アップロードしたデータは保存期限が切れたため、同梱のデータを表示しています")
+    st.session_state.pop("dataset")
+    source = None
+if source is None:
+    source = file_key(csv_path)
+    if source is not None and not is_complete(input_dir(source)):
+        # 検証エラーはCSVの内容ごとに覚えておき、再実行のたびに読み直さない
+        survey_error = cached_artifact("default_input", source, lambda: store_input_file(csv_path), track=False)
+        if survey_error is None and not is_complete(input_dir(source)):
+            # 記録上は取り込み済みでもストアから消えていれば入れ直す
+            survey_error = store_input_file(csv_path)
+        if survey_error:
+            st.sidebar.error(f"{csv_path} を取り込めませんでした: {survey_error}")
+            source = None
+if source is not None:
+    touch(input_dir(source))
+
+# 生成設定（入力のハッシュと合わせて成果物のキーになる）
+gen_options = {
+    "show_lines": st.sidebar.checkbox("線を表示", value=True),
+    "layout": st.sidebar.selectbox("ノード配置", LAYOUT_MODES, index=0),
+}
+artifact = make_artifact_key(source, gen_options) if source is not None else None
+if artifact is not None and request_artifact(artifact, source, gen_options):
+    st.session_state["artifact"] = (artifact, source)
+
+# 表示するのはこのセッションで最後に揃った成果物（生成中は前のものを表示し続ける）
+shown = st.session_state.get("artifact")
+if shown is not None and not is_complete(output_dir(shown[0])):
+    shown = None
+
+
+@st.fragment(run_every=2.0)
+def generation_status(key):
+    if key is None:
+        return
+    # 新しい成果物ができたら全体を再実行して切り替える
+    if is_complete(output_dir(key)):
+        if (st.session_state.get("artifact") or (None,))[0] != key:
+            st.rerun()
+        return
+    job = poll_generation().get(key)
+    if job is None:
+        return
+    if job["error"]:
+        st.error(f"生成に失敗しました: {job['error']}")
+        if st.button("🔁 再生成"):
+            retry_artifact(key)
             st.rerun()
+    else:
+        stage = job["stage"]
+        step = JOB_STAGES.index(stage) if stage in JOB_STAGES else 0
+        st.progress(step / len(JOB_STAGES), text=f"生成中: {stage}")
+
+
+with st.sidebar:
+    generation_status(artifact)
 
 # --- データの準備 ---
-json_path = "animation_data.json"
+paths = output_paths(shown[0]) if shown is not None else {}
+json_path = paths.get("output_path", "")
+bin_path = paths.get("binary_path", "")
 bg_path = "universe_bg.png"
-animation_data_json = "{}"
-bg_b64 = ""
+manifest = None
+data_key = None
+bg_url = ""
+all_colors = []
+# 利用可能なデータ形式（バイナリ優先、JSONは互換用）
+available_formats = [fmt for fmt, path in (("binary", bin_path), ("json", json_path)) if path and os.path.exists(path)]
+has_data = bool(available_formats)
+if has_data:
+    data_format = st.sidebar.radio("描画データ形式", available_formats, index=0, horizontal=True)
+    # layered: 確定済みの要素をオフスクリーンにキャッシュ / immediate: 毎フレーム全描画
+    # webgl: インスタンス描画（大規模データ向け、非対応ブラウザでは layered に切り替え）
+    render_mode = st.sidebar.radio("描画モード", ["layered", "immediate", "webgl"], index=0, horizontal=True)
+
+
+def load_survey_timed(source):
+    stats = {}
+    with measure_stage(stats, "survey_load"):
+        df = load_survey(input_paths(source)["cache"])
+    return df, stats
+
+
+# アンケートデータは表示中の成果物の入力を、取り込み済みのキャッシュからメモリマップで読む
+csv_key = shown[1] if shown is not None else source
+df_csv = None
+survey_stats = {}
+if csv_key is not None:
+    df_csv, survey_stats = cached_artifact("survey_df", csv_key, lambda: load_survey_timed(csv_key))
+
+
+TABLE_PAGE_SIZES = (50, 100, 500, 1000)
+BACKGROUND_SIZE = (800, 600)
+# スタンダード表示でデータの取得に失敗したときの試行回数
+STANDARD_LOAD_RETRIES = 5
+
+
+def publish_asset(name, data, ext, compress=True):
+    """Write ``data`` to static/ under a content-hashed name; return (url, bytes on disk).
+
+    The name changes whenever the content does, so both views and repeat
+    visits share one browser-cached copy. Payloads are stored gzipped and
+    inflated in the browser (static serving does not compress). Versions no
+    longer in use are removed by the store's LRU eviction (see evict_unused).
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    filename = f"{name}.{digest}.{ext}" + (".gz" if compress else "")
+    path = os.path.join(STATIC_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        with atomic_output(path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(data, mtime=0) if compress else data)
+    touch(path)
+    return "app/static/" + filename, os.path.getsize(path)
+
+
+def manifest_urls(manifest):
+    return [url for field, url in manifest.items() if field.endswith("url")]
+
+
+def build_payload(fmt):
+    """Publish the dataset for ``fmt``.
+
+    Returns (manifest, node colours, parse seconds, bytes served, stage timings).
+    """
+    stats = {}
+    with measure_stage(stats, f"payload_{fmt}"):
+        files, colors, parse_sec = assemble_payload(fmt, bin_path if fmt == "binary" else json_path, df_csv)
+        manifest = {"format": fmt}
+        size = 0
+        for field, (name, data, ext) in files.items():
+            manifest[field], file_size = publish_asset(name, data, ext)
+            size += file_size
+    return manifest, colors, parse_sec, size, stats
+
 
 # 最新のデータを読み込む
-if os.path.exists(json_path):
-    with open(json_path, "r", encoding='utf-8') as f:
-        anim_data = json.load(f)
-    
-    # カテゴリー名と色のマッピングを作成（フィルター用）
-    category_options = []
-    if os.path.exists("survey_data.csv"):
-        df_csv = pd.read_csv("survey_data.csv")
-        # 名前とGiftの紐付け
-        gift_map = pd.Series(df_csv.Q6_Gift.values, index=df_csv.Name).to_dict()
-        # カテゴリー(Q4_Switch)と色の紐付け
-        if 'Q4_Switch' in df_csv.columns:
-            category_options = sorted(df_csv['Q4_Switch'].unique().tolist())
-            cat_to_color = {}
-            # ノードデータから色情報を取得してカテゴリー名と紐付け
-            for node in anim_data['nodes']:
-                node['gift'] = gift_map.get(node['name'], "")
-                # 簡易的な紐付けロジック（実際はgen_animationの色順に依存）
-                pass
-
-    animation_data_json = json.dumps(anim_data)
-
-if os.path.exists(bg_path):
-    with open(bg_path, "rb") as f:
-        bg_b64 = base64.b64encode(f.read()).decode('utf-8')
+app_stats = dict(survey_stats)
+# このセッションが表示するもの（ほかのセッションの退避で消されないように記録する）
+shown_assets = [input_dir(key) for key in (source, csv_key) if key is not None]
+if shown is not None:
+    shown_assets.append(output_dir(shown[0]))
+if has_data:
+    payload_stats = {}
+    for fmt in available_formats:
+        fmt_key = (file_key(bin_path if fmt == "binary" else json_path), csv_key)
+        fmt_manifest, fmt_colors, parse_sec, size, fmt_stats = cached_artifact(
+            f"payload:{fmt}", fmt_key, lambda: build_payload(fmt), valid=lambda value: all(
+                os.path.exists(asset_path(url)) for url in manifest_urls(value[0])))
+        shown_assets += [asset_path(url) for url in manifest_urls(fmt_manifest)]
+        payload_stats[fmt] = (size, parse_sec)
+        app_stats.update(fmt_stats)
+        if fmt == data_format:
+            manifest = fmt_manifest
+            data_key = fmt_key
+            all_colors = sorted(set(fmt_colors))
+
+    # 配信サイズ（gzip後）と解析時間（ブラウザ側の解析時間はコンソールに出力）
+    with st.sidebar.expander("📦 ペイロード"):
+        for fmt, (size, parse_sec) in payload_stats.items():
+            st.write(f"{fmt}: {size / 1024:,.1f} KB / 解析 {parse_sec * 1000:.2f} ms")
+
+
+def publish_background():
+    # 800x600のキャンバス用に縮小したWebPだけを配信する
+    with Image.open(bg_path) as im:
+        small = im.resize(BACKGROUND_SIZE, Image.LANCZOS)
+    buf = io.BytesIO()
+    small.save(buf, "WEBP", quality=85)
+    return publish_asset("background", buf.getvalue(), "webp", compress=False)[0]
+
+
+bg_key = file_key(bg_path)
+if bg_key is not None:
+    bg_url = cached_artifact("background", bg_key, publish_background,
+                             valid=lambda url: os.path.exists(asset_path(url)))
+    shown_assets.append(asset_path(bg_url))
+record_shown(shown_assets)
+
+# ブラウザ側の描画コード（標準・インタラクティブ両方で共有）
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+with open(os.path.join(FRONTEND_DIR, "decoder.js"), encoding="utf-8") as f:
+    ANIMATION_DECODER_JS = f.read()
+with open(os.path.join(FRONTEND_DIR, "spatial_grid.js"), encoding="utf-8") as f:
+    SPATIAL_GRID_JS = f.read()
+with open(os.path.join(FRONTEND_DIR, "canvas_renderer.js"), encoding="utf-8") as f:
+    CANVAS_RENDERER_JS = f.read()
+with open(os.path.join(FRONTEND_DIR, "webgl_renderer.js"), encoding="utf-8") as f:
+    WEBGL_RENDERER_JS = f.read()
+
+# インタラクティブ表示は再実行をまたいで残る双方向コンポーネント（frontend/index.html）
+_star_network = components.declare_component("star_network", path=FRONTEND_DIR)
 
 # --- 1. スタンダード・アニメーション ---
-if os.path.exists(json_path):
+if has_data:
     st.subheader("📺 スタンダード・アニメーション")
     html_standard = f"""
     <!DOCTYPE html><html><head><style>
@@ -82,47 +489,28 @@ if os.path.exists(json_path):
     </style></head><body>
     <canvas id="canvas_std"></canvas>
     <script>
+        {ANIMATION_DECODER_JS}
+        {SPATIAL_GRID_JS}
+        {CANVAS_RENDERER_JS}
+        {WEBGL_RENDERER_JS}
         const canvas = document.getElementById('canvas_std');
-        const ctx = canvas.getContext('2d');
-        const data = {animation_data_json};
-        const bgData = "data:image/png;base64,{bg_b64}";
         let startTime = Date.now();
-        let bgImage = new Image();
-        function resize() {{
-            const dpr = window.devicePixelRatio || 1;
-            canvas.width = 800 * dpr; canvas.height = 600 * dpr;
-            ctx.scale(dpr, dpr);
+        let renderer = null;
+        // 読み込みに失敗したら間をおいて取り直す（失敗したままの空白表示にしない）
+        function load(attempt) {{
+            const bgImage = new Image();
+            bgImage.src = assetUrl("{bg_url}");
+            Promise.all([fetchAnimation({json.dumps(manifest)}), bgImage.decode()]).then(([data]) => {{
+                renderer = createRenderer(canvas, data, bgImage, "{render_mode}");
+                requestAnimationFrame(loop);
+            }}).catch(err => {{
+                console.warn("failed to load animation (attempt " + attempt + "): " + err.message);
+                if (attempt < {STANDARD_LOAD_RETRIES}) setTimeout(() => load(attempt + 1), 2000 * attempt);
+            }});
         }}
-        resize();
-        bgImage.src = bgData;
-        bgImage.onload = () => requestAnimationFrame(loop);
+        load(1);
         function loop() {{
-            const elapsed = (Date.now() - startTime) / 50;
-            ctx.clearRect(0,0,800,600);
-            ctx.drawImage(bgImage, 0, 0, 800, 600);
-            data.lines.forEach(l => {{
-                if (elapsed >= l.delay) {{
-                    const n1 = data.nodes[l.source], n2 = data.nodes[l.target];
-                    const a = Math.min(0.4, (elapsed - l.delay) / 320);
-                    ctx.beginPath();
-                    ctx.moveTo(100+((n1.x+500)/1000)*600, 600*(1-(n1.y+500)/1000));
-                    ctx.lineTo(100+((n2.x+500)/1000)*600, 600*(1-(n2.y+500)/1000));
-                    ctx.strokeStyle = "rgba(255, 255, 255, "+a+")"; ctx.lineWidth = 1; ctx.stroke();
-                }}
-            }});
-            data.nodes.forEach(n => {{
-                if (elapsed >= n.delay) {{
-                    const a = Math.min(1.0, (elapsed - n.delay) / 120);
-                    const x = 100+((n.x+500)/1000)*600, y = 600*(1-(n.y+500)/1000);
-                    const p = ((elapsed - n.delay) % 640) / 640;
-                    ctx.beginPath(); ctx.arc(x, y, (p*(n.score * 4.5)/1000)*600, 0, Math.PI*2);
-                    ctx.strokeStyle = n.color; ctx.lineWidth = 3; ctx.globalAlpha = Math.max(0, 1.2*(1-p)); ctx.stroke(); ctx.globalAlpha = 1;
-                    ctx.beginPath(); ctx.arc(x, y, 24, 0, Math.PI*2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.075)+")"; ctx.fill();
-                    ctx.beginPath(); ctx.arc(x, y, 8, 0, Math.PI*2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.2)+")"; ctx.fill();
-                    ctx.beginPath(); ctx.arc(x, y, 3, 0, Math.PI*2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.9)+")"; ctx.fill();
-                    ctx.fillStyle = "rgba(255,255,255,"+(a*0.7)+")"; ctx.font = 'bold 9px sans-serif'; ctx.fillText(n.name, x+8, y-5);
-                }}
-            }});
+            renderer.frame((Date.now() - startTime) / 50);
             requestAnimationFrame(loop);
         }}
     </script></body></html>
@@ -133,136 +521,60 @@ if os.path.exists(json_path):
 st.divider()
 st.subheader("🔍 インタラクティブ・分析")
 
-if os.path.exists(json_path):
+if has_data:
     # 色コードではなくカテゴリー名で選べるようにする
-    all_colors = sorted(list(set([n['color'] for n in anim_data['nodes']])))
     selected_colors = st.multiselect("カテゴリーフィルター（色の選択）", options=all_colors, default=[])
 
-    html_interactive = f"""
-    <!DOCTYPE html><html><head><style>
-        body {{ margin: 0; background-color: #020617; overflow: hidden; display: flex; justify-content: center; align-items: center; height: 700px; }}
-        #container {{ width: 800px; height: 600px; overflow: hidden; position: relative; cursor: crosshair; }}
-        canvas {{ display: block; image-rendering: -webkit-optimize-contrast; }}
-    </style></head><body>
-    <div id="container"><canvas id="canvas_int"></canvas></div>
-    <script>
-        const container = document.getElementById('container');
-        const canvas = document.getElementById('canvas_int');
-        const ctx = canvas.getContext('2d');
-        const data = {animation_data_json};
-        const activeColors = {json.dumps(selected_colors)};
-        const bgData = "data:image/png;base64,{bg_b64}";
-        
-        if (!window.sessionStorage.getItem('animStartTime')) window.sessionStorage.setItem('animStartTime', Date.now());
-        const startTime = parseInt(window.sessionStorage.getItem('animStartTime'));
-
-        let bgImage = new Image();
-        let scale = 1, viewX = 0, viewY = 0, isDragging = false, lastX = 0, lastY = 0, selectedNode = null;
-
-        function resize() {{
-            const dpr = window.devicePixelRatio || 1;
-            canvas.width = 800 * dpr; canvas.height = 600 * dpr;
-            canvas.style.width = '800px'; canvas.style.height = '600px';
-            ctx.scale(dpr, dpr);
-        }}
-        resize();
-        bgImage.src = bgData;
-        bgImage.onload = () => requestAnimationFrame(loop);
-
-        // マウス操作とクリック判定
-        container.addEventListener('mousedown', e => {{ isDragging = true; lastX = e.clientX; lastY = e.clientY; }});
-        window.addEventListener('mouseup', () => isDragging = false);
-        window.addEventListener('mousemove', e => {{
-            if (isDragging) {{
-                viewX += (e.clientX - lastX) / scale; viewY += (e.clientY - lastY) / scale;
-                lastX = e.clientX; lastY = e.clientY;
-            }}
-        }});
-        container.addEventListener('wheel', e => {{
-            if (e.ctrlKey) {{ e.preventDefault(); const z = e.deltaY > 0 ? 0.9 : 1.1; scale = Math.min(Math.max(1, scale * z), 10); }}
-        }}, {{ passive: false }});
-
-        container.addEventListener('click', e => {{
-            const rect = container.getBoundingClientRect();
-            const mx = (e.clientX - rect.left) / scale - viewX;
-            const my = (e.clientY - rect.top) / scale - viewY;
-            let found = null;
-            data.nodes.forEach(n => {{
-                const nx = 100+((n.x+500)/1000)*600, ny = 600*(1-(n.y+500)/1000);
-                if (Math.sqrt((mx-nx)**2 + (my-ny)**2) < 15/scale) found = n;
-            }});
-            selectedNode = (selectedNode === found) ? null : found;
-        }});
-
-        function loop() {{
-            const elapsed = (Date.now() - startTime) / 50;
-            ctx.clearRect(0,0,800,600);
-            ctx.save();
-            ctx.scale(scale, scale); ctx.translate(viewX, viewY);
-            ctx.drawImage(bgImage, 0, 0, 800, 600);
-            
-            // 線
-            data.lines.forEach(l => {{
-                if (elapsed >= l.delay) {{
-                    const n1 = data.nodes[l.source], n2 = data.nodes[l.target];
-                    if (activeColors.length === 0 || activeColors.includes(n1.color) || activeColors.includes(n2.color)) {{
-                        const a = Math.min(0.4, (elapsed - l.delay) / 320);
-                        ctx.beginPath(); ctx.moveTo(100+((n1.x+500)/1000)*600, 600*(1-(n1.y+500)/1000));
-                        ctx.lineTo(100+((n2.x+500)/1000)*600, 600*(1-(n2.y+500)/1000));
-                        ctx.strokeStyle = "rgba(255, 255, 255, "+a+")"; ctx.lineWidth = 1/scale; ctx.stroke();
-                    }}
-                }}
-            }});
+    # データは読み込み済みのキーと違うときだけ送り、フィルター変更では状態だけ送る
+    dataset_key = hashlib.sha256(repr((data_format, data_key, bg_key)).encode()).hexdigest()[:16]
+    state = st.session_state.get("star_network") or {}
+    needs_dataset = state.get("loaded") != dataset_key
+    value = _star_network(
+        dataset_key=dataset_key,
+        dataset=manifest if needs_dataset else None,
+        background=bg_url if needs_dataset else None,
+        active_colors=selected_colors,
+        render_mode=render_mode,
+        key="star_network",
+        default=None,
+    )
 
-            // 点と波紋
-            data.nodes.forEach(n => {{
-                if (elapsed >= n.delay) {{
-                    const isSel = activeColors.length === 0 || activeColors.includes(n.color);
-                    const a = (isSel ? 1 : 0.1) * Math.min(1, (elapsed - n.delay)/120);
-                    const x = 100+((n.x+500)/1000)*600, y = 600*(1-(n.y+500)/1000);
-                    
-                    if (isSel) {{
-                        const p = ((elapsed - n.delay) % 640) / 640;
-                        ctx.beginPath(); ctx.arc(x, y, (p*(n.score*4.5)/1000)*600, 0, Math.PI * 2);
-                        ctx.strokeStyle = n.color; ctx.lineWidth = 3/scale; ctx.globalAlpha = Math.max(0, 1.2*(1-p)); ctx.stroke(); ctx.globalAlpha = 1;
-                    }}
-                    ctx.beginPath(); ctx.arc(x, y, 24, 0, Math.PI * 2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.075)+")"; ctx.fill();
-                    ctx.beginPath(); ctx.arc(x, y, 8, 0, Math.PI * 2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.2)+")"; ctx.fill();
-                    ctx.beginPath(); ctx.arc(x, y, 3, 0, Math.PI * 2); ctx.fillStyle = "rgba(255,255,255,"+(a*0.9)+")"; ctx.fill();
-                    ctx.fillStyle = "rgba(255,255,255,"+(a*0.7)+")"; ctx.font = `bold ${{9/scale}}px sans-serif`; ctx.fillText(n.name, x+8/scale, y-5/scale);
-
-                    // --- ポップアップデザイン修正 (下線 + 斜め引き出し線) ---
-                    if (selectedNode === n && n.gift) {{
-                        const txt = n.gift; 
-                        ctx.font = `bold ${{10/scale}}px sans-serif`;
-                        const tw = ctx.measureText(txt).width;
-                        const bx = x - tw - 15/scale, by = y - 15/scale;
-                        
-                        ctx.beginPath(); 
-                        ctx.moveTo(x - 4/scale, y - 4/scale); 
-                        ctx.lineTo(bx + tw, by + 2/scale);
-                        ctx.strokeStyle = "rgba(255, 255, 255, 0.7)"; 
-                        ctx.lineWidth = 1/scale; ctx.stroke();
-                        
-                        ctx.fillStyle = "white"; ctx.textAlign = "left"; 
-                        ctx.fillText(txt, bx, by);
-                        
-                        ctx.beginPath(); ctx.moveTo(bx, by + 2/scale); ctx.lineTo(bx + tw, by + 2/scale);
-                        ctx.strokeStyle = "rgba(255, 255, 255, 0.9)"; ctx.lineWidth = 1/scale; ctx.stroke();
-                        ctx.textAlign = "left";
-                    }}
-                }}
-            }});
-            ctx.restore(); requestAnimationFrame(loop);
-        }}
-    </script></body></html>
-    """
-    # 乱数をキーにして毎回コンポーネントを強制再描画させる
-    components.html(html_interactive, height=720, key=f"anim_{len(animation_data_json)}")
+    # 選択されたノードの情報
+    # ノードの id は行の位置（同名の回答者がいるので名前では引かない）
+    selected = (value or {}).get("selected")
+    if selected and df_csv is not None and 0 <= selected["id"] < len(df_csv):
+        row = df_csv.iloc[selected["id"]]
+        st.markdown(f"**{row.Name}** — 🎁 {row.Q6_Gift}")
 
 # --- 3. データテーブル ---
 st.divider()
 st.subheader("📊 アンケート元データ")
-if os.path.exists("survey_data.csv"):
-    df = pd.read_csv("survey_data.csv")
-    st.dataframe(df, use_container_width=True)
+if df_csv is not None:
+    # 大きなデータでも1ページ分だけブラウザに送る
+    page_col, size_col = st.columns([3, 1])
+    page_size = size_col.selectbox("表示件数", TABLE_PAGE_SIZES, index=1)
+    num_pages = max(1, -(-len(df_csv) // page_size))
+    page = page_col.number_input(f"ページ（全 {num_pages:,} ページ / {len(df_csv):,} 行）",
+                                 min_value=1, max_value=num_pages, value=1, step=1)
+    start = (page - 1) * page_size
+    st.dataframe(df_csv.iloc[start:start + page_size], use_container_width=True)
+
+# キャッシュのヒット/ミス表示
+with cache_panel.container():
+    with st.expander("🗂 キャッシュ"):
+        cache_stats = st.session_state.get("cache_stats", {})
+        for name, hit in cache_run_status.items():
+            hits, misses = cache_stats.get(name, [0, 0])
+            st.write(f"{'✅' if hit else '🔄'} {name}: ヒット {hits} / ミス {misses}")
+
+# デバッグ用：表示中のデータのステージ別処理時間（取り込み + 生成ジョブ + アプリ側、キャッシュ済みのものは計算時の値）
+if st.sidebar.checkbox("🐞 ステージ別の処理時間"):
+    with st.sidebar.expander("⏱ 処理時間", expanded=True):
+        input_stats = load_input_stats(csv_key) if csv_key is not None else None
+        generation_stats = load_generation_stats(shown[0]) if shown is not None else None
+        st.caption("CSV取り込み")
+        st.code(format_stats(input_stats) if input_stats else "（記録なし）")
+        st.caption("生成ジョブ")
+        st.code(format_stats(generation_stats) if generation_stats else "（記録なし）")
+        st.caption("アプリ")
+        st.code(format_stats(app_stats) or "（記録なし）")
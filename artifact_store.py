@@ -0,0 +1,217 @@
+"""Content-addressed store for survey inputs and generated artifacts.
+
+Each CSV is stored once under its sha256 (``inputs/<sha>/``) together with its
+validated Feather cache, and each generation under a hash of that sha plus the
+generation options (``outputs/<key>/``). Sessions only hold these hashes, so
+concurrent uploads never overwrite each other and sessions viewing the same
+data with the same options share one copy.
+
+An entry counts as present once its ``.complete`` marker exists. Entries are
+touched when used, and :func:`evict` removes the least recently used ones once
+the store (plus any extra directories such as the published static assets)
+grows past a size limit.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from gen_animation import SURVEY_CACHE_PATH, atomic_output, ingest_survey_csv, measure_stage, run_generation_job
+
+STORE_DIR = "artifacts"
+# 入力・生成物・配信用アセットを合わせたディスク使用量の上限
+STORE_LIMIT_BYTES = 2 * 2**30
+COMPLETE_MARKER = ".complete"
+INPUT_FILES = {"csv": "survey_data.csv", "cache": SURVEY_CACHE_PATH}
+# generate_animation_from_df の引数名 → 保存先のファイル名
+OUTPUT_FILES = {
+    "output_path": "animation_data.json",
+    "binary_path": "animation_data.bin",
+    "static_path": "static_network_glow.png",
+    "state_path": "animation_state.npz",
+}
+# 取り込み・生成時のステージ別の処理時間（format_stats 形式の dict）
+STATS_FILE = "generation_stats.json"
+INPUT_STATS_FILE = "ingest_stats.json"
+
+
+def input_dir(source, root=STORE_DIR):
+    return os.path.join(root, "inputs", source)
+
+
+def input_paths(source, root=STORE_DIR):
+    """``{"csv": ..., "cache": ...}`` for the stored input ``source``."""
+    return {name: os.path.join(input_dir(source, root), filename) for name, filename in INPUT_FILES.items()}
+
+
+def artifact_key(source, options):
+    """Hash of the input sha256 and the generation options (a JSON-serialisable dict)."""
+    blob = json.dumps({"source": source, "options": options}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def output_dir(key, root=STORE_DIR):
+    return os.path.join(root, "outputs", key)
+
+
+def output_paths(key, root=STORE_DIR):
+    """Output file paths for ``key``, named like the arguments of ``generate_animation_from_df``."""
+    return {name: os.path.join(output_dir(key, root), filename) for name, filename in OUTPUT_FILES.items()}
+
+
+def is_complete(directory):
+    return os.path.exists(os.path.join(directory, COMPLETE_MARKER))
+
+
+def touch(path):
+    """Mark ``path`` as recently used for LRU eviction."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _install(tmp_dir, target, parent):
+    """Move the finished ``tmp_dir`` to ``target`` unless a complete copy is already there."""
+    try:
+        # 空でないディレクトリには置き換わらないので、完成済みのものを消すことはない
+        os.replace(tmp_dir, target)
+        return
+    except OSError:
+        pass
+    if is_complete(target):
+        # 同じ内容が同時に保存された（中身は同じなので先着を使う）
+        return
+    # 完了印のない作りかけだけを脇へよけて消し、置き直す
+    stale = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        os.replace(target, stale)
+    except OSError:
+        pass
+    shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, target)
+    except OSError:
+        pass
+
+
+def store_input(fileobj, root=STORE_DIR):
+    """Copy a CSV (file object) into the store, validate it and build its cache; return its sha256.
+
+    Raises ``ValueError`` from :func:`gen_animation.ingest_survey_csv` when
+    validation fails, in which case nothing is stored. Storing the same
+    content again only touches the existing entry. The ingest time is saved
+    as ``csv_parse`` (see :func:`load_input_stats`).
+    """
+    parent = os.path.join(root, "inputs")
+    os.makedirs(parent, exist_ok=True)
+    # 途中のものは一時ディレクトリに作り、完成してから名前を付ける
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        digest = hashlib.sha256()
+        with open(os.path.join(tmp_dir, INPUT_FILES["csv"]), "wb") as f:
+            for block in iter(lambda: fileobj.read(1 << 20), b""):
+                digest.update(block)
+                f.write(block)
+        source = digest.hexdigest()
+        target = input_dir(source, root)
+        if not is_complete(target):
+            stats = {}
+            with measure_stage(stats, "csv_parse"):
+                ingest_survey_csv(os.path.join(tmp_dir, INPUT_FILES["csv"]), os.path.join(tmp_dir, INPUT_FILES["cache"]))
+            with open(os.path.join(tmp_dir, INPUT_STATS_FILE), "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            open(os.path.join(tmp_dir, COMPLETE_MARKER), "w").close()
+            _install(tmp_dir, target, parent)
+        touch(target)
+        return source
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def generate_artifact(key, source, options, root=STORE_DIR):
+    """Pool-worker entry point: generate the outputs for ``key`` and mark them complete.
+
+    Progress is reported with ``key`` as the job id (see
+    :func:`gen_animation.init_job_worker`). Stage timings are saved next to
+    the outputs (see :func:`load_generation_stats`).
+    """
+    directory = output_dir(key, root)
+    os.makedirs(directory, exist_ok=True)
+    stats = {}
+    run_generation_job(key, input_paths(source, root)["cache"], stats=stats, **output_paths(key, root), **options)
+    with atomic_output(os.path.join(directory, STATS_FILE)) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    open(os.path.join(directory, COMPLETE_MARKER), "w").close()
+    return key
+
+
+def _load_stats(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_input_stats(source, root=STORE_DIR):
+    """Stage timings recorded when ``source`` was ingested (``csv_parse``), or None."""
+    return _load_stats(os.path.join(input_dir(source, root), INPUT_STATS_FILE))
+
+
+def load_generation_stats(key, root=STORE_DIR):
+    """Stage timings recorded when ``key`` was generated, or None."""
+    return _load_stats(os.path.join(output_dir(key, root), STATS_FILE))
+
+
+def _entry_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def evict(limit=STORE_LIMIT_BYTES, protect=(), extra_dirs=(), root=STORE_DIR):
+    """Remove least recently used entries until the total size is at most ``limit``.
+
+    Entries are the input and output directories under ``root`` and the files
+    directly inside ``extra_dirs``. Paths in ``protect`` (e.g. running jobs
+    and what the current session shows) are never removed. Returns the
+    removed paths.
+    """
+    protect = {os.path.abspath(p) for p in protect}
+    entries = []
+    for directory in [os.path.join(root, "inputs"), os.path.join(root, "outputs"), *extra_dirs]:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            # 作成途中の一時ファイル・ディレクトリは数えない
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, _entry_size(entry.path), entry.path))
+            except FileNotFoundError:
+                pass
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if os.path.abspath(path) in protect:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed.append(path)
+    return removed
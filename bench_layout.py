@@ -0,0 +1,99 @@
+"""Benchmark the layout modes of gen_animation against networkx.spring_layout.
+
+Usage: python bench_layout.py [--sizes 1000 5000 50000] [--nx-max 5000] [--json out.json]
+
+networkx needs scipy for spring_layout on graphs of 500 nodes or more;
+without it the networkx row is skipped with a message.
+
+For each size a synthetic survey (same categories, Q2 1-10) is laid out with
+every mode. The force layout is also compared with networkx on the same
+similarity graph, where networkx is affordable. Quality is reported as:
+
+- edge_ratio: mean length of the similarity edges divided by the mean
+  distance between random pairs (lower means similar answers sit closer).
+- same_category: share of each node's 10 nearest neighbours in the same
+  category, on a sample of nodes.
+"""
+import argparse
+import json
+import time
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from gen_animation import (LAYOUT_MODES, LAYOUT_SEED, SWITCH_ORDER, cluster_centers, clustered_offsets,
+                           compute_layout, fit_to_content, prepare_nodes, similarity_edges)
+
+
+def synthetic_nodes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Name": [f"bench{i}" for i in range(n)],
+        "Q2": rng.integers(1, 11, n),
+        "Q4_Switch": np.array(SWITCH_ORDER)[rng.integers(0, len(SWITCH_ORDER), n)],
+    })
+    return prepare_nodes(df)
+
+
+def layout_quality(pos, switch, source, target, sample=500, seed=0):
+    rng = np.random.default_rng(seed)
+    edge_len = np.linalg.norm(pos[source] - pos[target], axis=1).mean()
+    a, b = rng.integers(0, len(pos), (2, 10000))
+    pair_len = np.linalg.norm(pos[a] - pos[b], axis=1).mean()
+    picked = rng.choice(len(pos), min(sample, len(pos)), replace=False)
+    d = np.linalg.norm(pos[picked, None, :] - pos[None, :, :], axis=2)
+    d[np.arange(len(picked)), picked] = np.inf
+    nearest = np.argpartition(d, 10, axis=1)[:, :10]
+    same = (switch[nearest] == switch[picked, None]).mean()
+    return {"edge_ratio": float(edge_len / pair_len), "same_category": float(same)}
+
+
+def bench_size(n, nx_max):
+    nodes = synthetic_nodes(n)
+    switch = nodes["switch"]
+    source, target = similarity_edges(switch, nodes["score"])
+    results = []
+    for mode in LAYOUT_MODES:
+        t0 = time.perf_counter()
+        x, y = compute_layout(nodes, mode)
+        sec = time.perf_counter() - t0
+        results.append({"n": n, "layout": mode, "sec": sec,
+                        **layout_quality(np.column_stack([x, y]), switch, source, target)})
+    if n <= nx_max:
+        # 同じ初期配置・同じグラフで networkx の Fruchterman-Reingold と比べる
+        counts = np.bincount(switch, minlength=len(SWITCH_ORDER) + 1)
+        start = cluster_centers(len(counts))[switch] + clustered_offsets(np.random.default_rng(LAYOUT_SEED), counts[switch], n)
+        graph = nx.Graph()
+        graph.add_nodes_from(range(n))
+        graph.add_edges_from(zip(source.tolist(), target.tolist()))
+        t0 = time.perf_counter()
+        try:
+            layout = nx.spring_layout(graph, pos={i: p for i, p in enumerate(start)}, iterations=50, seed=LAYOUT_SEED)
+        except ImportError as e:
+            # 500ノード以上では networkx が scipy を使う
+            print(f"{n:>7} networkx.spring_layout skipped: {e}")
+            return results
+        sec = time.perf_counter() - t0
+        pos = fit_to_content(np.array([layout[i] for i in range(n)]))
+        results.append({"n": n, "layout": "networkx.spring_layout", "sec": sec,
+                        **layout_quality(pos, switch, source, target)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 50000], help='Node counts')
+    parser.add_argument('--nx-max', type=int, default=5000, help='Largest size also run through networkx')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        for row in bench_size(n, args.nx_max):
+            print(f"{row['n']:>7} {row['layout']:<24} {row['sec']:8.2f}s  "
+                  f"edge_ratio {row['edge_ratio']:.3f}  same_category {row['same_category']:.3f}")
+            results.append(row)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
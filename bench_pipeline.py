@@ -0,0 +1,177 @@
+"""Benchmark the generation pipeline stage by stage on synthetic surveys.
+
+Usage: python bench_pipeline.py [--sizes 100 1000 10000 100000] [--json out.json] [--compare old.json]
+                                [--no-lines | --lines-max-rows N]
+       python bench_pipeline.py --write-csv DIR [--sizes ...]
+
+The synthetic surveys follow the schema and answer mix of survey_data.csv:
+the same columns, category shares, Q2/Q5 distributions and gift messages,
+and about the same share of repeated names. For each size these stages are
+measured:
+
+- csv_parse: validated, chunked ingest into the Feather cache
+- survey_load: memory-mapped load of that cache
+- prep, layout, edges, binary, json, png: generate_animation_from_df
+- payload_binary, payload_json: the app-side payload assembly, gzip included
+
+Each size runs twice: once for wall time and once under tracemalloc for the
+peak memory of each stage (tracing slows string-heavy stages down a lot, so
+its times are not reported). --no-memory skips the second run. Results are
+written as JSON after every size; --compare prints the time ratio against an
+earlier file.
+
+With lines on (the app default) every pair of nodes closer than the edge
+threshold is connected, so the edge count grows with the square of the
+density: at 10k rows there are already about 5 million lines. Lines are
+therefore only drawn up to --lines-max-rows rows (each result records
+``show_lines``); --no-lines turns them off for every size. 1M rows can be
+added with --sizes; expect its static image alone to take several minutes.
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from gen_animation import assemble_payload, generate_animation_from_df, ingest_survey_csv, load_survey, measure_stage
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+# これより多い行数では線を引かない（線の数は行数の2乗で増える）
+LINES_MAX_ROWS = 2000
+# 分布の元にする実データ
+TEMPLATE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "survey_data.csv")
+
+
+def synthetic_survey(n, seed=0, template=TEMPLATE_CSV):
+    """``n`` survey rows drawn from the answer distributions of ``template``."""
+    ref = pd.read_csv(template)
+    rng = np.random.default_rng(seed)
+    # 元データと同じ割合で名前が重複するように、名前の数を行数に比例させる
+    base = ref["Name"].astype(str).unique()
+    pool = max(1, round(n * len(base) / len(ref)))
+    names = np.array([f"{base[i % len(base)]}{i // len(base) or ''}" for i in range(pool)], dtype=object)
+    switch = ref["Q4_Switch"].value_counts(normalize=True)
+    columns = {
+        "Name": names[rng.integers(0, pool, n)],
+        "Q4_Switch": rng.choice(switch.index.to_numpy(dtype=object), n, p=switch.to_numpy()),
+    }
+    for column in ref.columns:
+        if column not in columns:
+            columns[column] = rng.choice(ref[column].to_numpy(), n)
+    return pd.DataFrame({column: columns[column] for column in ref.columns})
+
+
+def run_pipeline(csv_path, workdir, trace_memory=False, show_lines=True):
+    """Run every stage once on ``csv_path``; return the ``measure_stage`` stats."""
+    stats = {}
+    cache_path = os.path.join(workdir, "survey_data.feather")
+    paths = {
+        "output_path": os.path.join(workdir, "animation_data.json"),
+        "binary_path": os.path.join(workdir, "animation_data.bin"),
+        "static_path": os.path.join(workdir, "static_network_glow.png"),
+        "state_path": os.path.join(workdir, "animation_state.npz"),
+    }
+    with measure_stage(stats, "csv_parse", trace_memory):
+        ingest_survey_csv(csv_path, cache_path)
+    with measure_stage(stats, "survey_load", trace_memory):
+        df = load_survey(cache_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_animation_from_df(df, show_lines=show_lines, stats=stats, trace_memory=trace_memory, **paths)
+    for fmt, path in (("binary", paths["binary_path"]), ("json", paths["output_path"])):
+        with measure_stage(stats, f"payload_{fmt}", trace_memory):
+            files, _, _ = assemble_payload(fmt, path, df)
+            for _, data, _ in files.values():
+                gzip.compress(data, mtime=0)
+    return stats
+
+
+def bench_size(n, workdir, memory=True, show_lines=True):
+    csv_path = os.path.join(workdir, f"survey_{n}.csv")
+    synthetic_survey(n).to_csv(csv_path, index=False)
+    timed = run_pipeline(csv_path, workdir, show_lines=show_lines)
+    traced = run_pipeline(csv_path, workdir, trace_memory=True, show_lines=show_lines) if memory else {}
+    stages = {}
+    for key, sec in timed.items():
+        if key.endswith("_sec"):
+            name = key[:-len("_sec")]
+            stages[name] = {"sec": sec, "peak_bytes": traced.get(f"{name}_peak_bytes")}
+    return {"rows": n, "show_lines": show_lines, "stages": stages}
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_result(result, previous=None):
+    if not result["show_lines"]:
+        print(f"{result['rows']:>8} (without lines)")
+    for name, stage in result["stages"].items():
+        line = f"{result['rows']:>8} {name:<15} {stage['sec']:9.3f}s"
+        if stage["peak_bytes"] is not None:
+            line += f"  peak {stage['peak_bytes'] / 2**20:9.1f} MiB"
+        old = (previous or {}).get(name)
+        if old:
+            line += f"  x{stage['sec'] / max(old['sec'], 1e-9):.2f} vs {old['sec']:.3f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Row counts')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Earlier results file to compare times against')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run (peak memory)')
+    parser.add_argument('--no-lines', action='store_true', help='Generate without network lines')
+    parser.add_argument('--lines-max-rows', type=int, default=LINES_MAX_ROWS,
+                        help='Generate without network lines above this many rows')
+    parser.add_argument('--write-csv', metavar='DIR', help='Only write the synthetic survey_<rows>.csv files to DIR')
+    args = parser.parse_args()
+    # 日本語フォントのない環境では静止画のラベルごとに警告が出て結果が読めなくなる
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+    if args.write_csv:
+        os.makedirs(args.write_csv, exist_ok=True)
+        for n in args.sizes:
+            path = os.path.join(args.write_csv, f"survey_{n}.csv")
+            synthetic_survey(n).to_csv(path, index=False)
+            print(f"Wrote {path}")
+        raise SystemExit(0)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = {r["rows"]: r["stages"] for r in json.load(f)["results"]}
+
+    report = {"meta": run_metadata(), "results": []}
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            show_lines = not args.no_lines and n <= args.lines_max_rows
+            result = bench_size(n, workdir, memory=not args.no_memory, show_lines=show_lines)
+        print_result(result, previous.get(n))
+        report["results"].append(result)
+        if args.json:
+            # 大きいサイズの途中で止めても、それまでの結果は残す
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
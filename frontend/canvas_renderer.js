@@ -0,0 +1,247 @@
+// Canvas2D renderer shared by the standard and interactive views.
+//
+// mode "layered":   background + settled edges and settled node glows/labels are
+//                   baked into offscreen layers. Each frame only composites the
+//                   layers and draws ripples plus the items still fading in.
+//                   Nodes and lines are walked in delay order, so a frame only
+//                   touches the part of the schedule that is currently changing.
+// mode "immediate": every item is redrawn every frame (original behaviour).
+//
+// Both modes only visit nodes and lines inside the current viewport (see
+// createViewIndex). While the view is moving, the baked layers are reused
+// with a transform and rebuilt once the view has been still for SETTLE_MS.
+// Labels are drawn only when at most LABEL_BUDGET nodes are in view.
+function createCanvasRenderer(canvas, data, bgImage, options) {
+    const W = 800, H = 600;
+    const EDGE_ALPHA = 0.4, EDGE_FADE = 320, NODE_FADE = 120, RIPPLE_PERIOD = 640;
+    // 線のアルファは EDGE_ALPHA で頭打ちになるので、それ以降は変化しない
+    const EDGE_SETTLE = EDGE_ALPHA * EDGE_FADE;
+    const GLOW_RADIUS = 24;
+    const CULL_MARGIN = 40, SETTLE_MS = 150, LABEL_BUDGET = 400;
+    const mode = (options && options.mode) || "layered";
+
+    const ctx = canvas.getContext('2d');
+    const dpr = window.devicePixelRatio || 1;
+    canvas.width = W * dpr; canvas.height = H * dpr;
+    canvas.style.width = W + 'px'; canvas.style.height = H + 'px';
+
+    const col = data.columns, palette = data.palette;
+    const n = data.count;
+    const px = new Float32Array(n), py = new Float32Array(n);
+    for (let i = 0; i < n; i++) {
+        px[i] = 100 + ((col.x[i] + 500) / 1000) * 600;
+        py[i] = 600 * (1 - (col.y[i] + 500) / 1000);
+    }
+    const index = createViewIndex(px, py, col.delay, col.source, col.target, col.line_delay);
+    const nodeDelay = i => col.delay[i], lineDelay = k => col.line_delay[k];
+
+    let view = { scale: 1, x: 0, y: 0 }, viewChangedAt = 0;
+    let visible = index.visible(view, CULL_MARGIN);
+    // パレットの色ごとにフィルター対象かどうか
+    let activeColors = [], paletteActive = palette.map(() => true);
+    let selectedNode = null;
+
+    // オフスクリーンのレイヤーと光彩スプライト（baked.view の表示状態で焼き込む）
+    let baked = null, sprite = null;
+
+    function makeLayer(w, h) {
+        const c = document.createElement('canvas');
+        c.width = w; c.height = h;
+        return c;
+    }
+    function applyView(c) {
+        const s = dpr * view.scale;
+        c.setTransform(s, 0, 0, s, s * view.x, s * view.y);
+    }
+    function sameView(a, b) {
+        return a.scale === b.scale && a.x === b.x && a.y === b.y;
+    }
+    function labelsOn(vis) {
+        return vis.nodes.length <= LABEL_BUDGET;
+    }
+    function isActive(i) {
+        return paletteActive[col.color[i]];
+    }
+    function lineVisible(k) {
+        return activeColors.length === 0 || isActive(col.source[k]) || isActive(col.target[k]);
+    }
+    function nodeAlpha(i, elapsed) {
+        return (isActive(i) ? 1 : 0.1) * Math.min(1, (elapsed - col.delay[i]) / NODE_FADE);
+    }
+
+    function drawLine(c, k, a) {
+        c.beginPath();
+        c.moveTo(px[col.source[k]], py[col.source[k]]);
+        c.lineTo(px[col.target[k]], py[col.target[k]]);
+        c.strokeStyle = "rgba(255, 255, 255, " + a + ")"; c.lineWidth = 1 / view.scale; c.stroke();
+    }
+    function drawRipple(c, i, elapsed) {
+        const p = ((elapsed - col.delay[i]) % RIPPLE_PERIOD) / RIPPLE_PERIOD;
+        c.beginPath(); c.arc(px[i], py[i], (p * (col.score[i] * 4.5) / 1000) * 600, 0, Math.PI * 2);
+        c.strokeStyle = palette[col.color[i]]; c.lineWidth = 3 / view.scale; c.globalAlpha = Math.max(0, 1.2 * (1 - p)); c.stroke(); c.globalAlpha = 1;
+    }
+    function drawGlowArcs(c, i, a) {
+        const x = px[i], y = py[i];
+        c.beginPath(); c.arc(x, y, GLOW_RADIUS, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255," + (a * 0.075) + ")"; c.fill();
+        c.beginPath(); c.arc(x, y, 8, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255," + (a * 0.2) + ")"; c.fill();
+        c.beginPath(); c.arc(x, y, 3, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255," + (a * 0.9) + ")"; c.fill();
+    }
+    function buildSprite() {
+        // 3重の円を一枚に焼き込み、ノードごとの arc/fill を drawImage 一回にする
+        const res = dpr * view.scale;
+        const size = Math.ceil(GLOW_RADIUS * 2 * res);
+        sprite = makeLayer(size, size);
+        const c = sprite.getContext('2d');
+        c.setTransform(size / (GLOW_RADIUS * 2), 0, 0, size / (GLOW_RADIUS * 2), size / 2, size / 2);
+        c.beginPath(); c.arc(0, 0, GLOW_RADIUS, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255,0.075)"; c.fill();
+        c.beginPath(); c.arc(0, 0, 8, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255,0.2)"; c.fill();
+        c.beginPath(); c.arc(0, 0, 3, 0, Math.PI * 2); c.fillStyle = "rgba(255,255,255,0.9)"; c.fill();
+    }
+    function drawGlowSprite(c, i, a) {
+        c.globalAlpha = a;
+        c.drawImage(sprite, px[i] - GLOW_RADIUS, py[i] - GLOW_RADIUS, GLOW_RADIUS * 2, GLOW_RADIUS * 2);
+        c.globalAlpha = 1;
+    }
+    function drawLabel(c, i, a) {
+        c.fillStyle = "rgba(255,255,255," + (a * 0.7) + ")"; c.font = `bold ${9 / view.scale}px sans-serif`;
+        c.fillText(data.names[i], px[i] + 8 / view.scale, py[i] - 5 / view.scale);
+    }
+    function drawSelection(c, elapsed) {
+        // --- ポップアップ (下線 + 斜め引き出し線) ---
+        const n = selectedNode;
+        if (n === null || !n.gift || elapsed < n.delay) return;
+        const i = n.id, x = px[i], y = py[i], s = view.scale;
+        const txt = n.gift;
+        c.font = `bold ${10 / s}px sans-serif`;
+        const tw = c.measureText(txt).width;
+        const bx = x - tw - 15 / s, by = y - 15 / s;
+
+        c.beginPath();
+        c.moveTo(x - 4 / s, y - 4 / s);
+        c.lineTo(bx + tw, by + 2 / s);
+        c.strokeStyle = "rgba(255, 255, 255, 0.7)";
+        c.lineWidth = 1 / s; c.stroke();
+
+        c.fillStyle = "white"; c.textAlign = "left";
+        c.fillText(txt, bx, by);
+
+        c.beginPath(); c.moveTo(bx, by + 2 / s); c.lineTo(bx + tw, by + 2 / s);
+        c.strokeStyle = "rgba(255, 255, 255, 0.9)"; c.lineWidth = 1 / s; c.stroke();
+    }
+
+    function bake() {
+        baked = {
+            view: view, visible: visible, labels: labelsOn(visible),
+            edgeLayer: makeLayer(canvas.width, canvas.height), nodeLayer: makeLayer(canvas.width, canvas.height),
+            settledLines: 0, settledNodes: 0
+        };
+        const ec = baked.edgeLayer.getContext('2d');
+        applyView(ec);
+        ec.drawImage(bgImage, 0, 0, W, H);
+        applyView(baked.nodeLayer.getContext('2d'));
+        buildSprite();
+    }
+    function advanceBake(elapsed) {
+        // 変化しなくなった線・ノードをレイヤーに焼き込む
+        const b = baked, vis = b.visible;
+        const ec = b.edgeLayer.getContext('2d'), nc = b.nodeLayer.getContext('2d');
+        while (b.settledLines < vis.lines.length && col.line_delay[vis.lines[b.settledLines]] + EDGE_SETTLE <= elapsed) {
+            const k = vis.lines[b.settledLines++];
+            if (lineVisible(k)) drawLine(ec, k, EDGE_ALPHA);
+        }
+        while (b.settledNodes < vis.nodes.length && col.delay[vis.nodes[b.settledNodes]] + NODE_FADE <= elapsed) {
+            const i = vis.nodes[b.settledNodes++];
+            const a = nodeAlpha(i, elapsed);
+            drawGlowSprite(nc, i, a);
+            if (b.labels) drawLabel(nc, i, a);
+        }
+    }
+    function blit(layer) {
+        // 焼き込み時の表示状態から現在の表示状態への変換をかけて貼る
+        const v0 = baked.view, k = view.scale / v0.scale;
+        ctx.setTransform(dpr * k, 0, 0, dpr * k, dpr * view.scale * (view.x - v0.x), dpr * view.scale * (view.y - v0.y));
+        ctx.drawImage(layer, 0, 0, W, H);
+        applyView(ctx);
+    }
+
+    function frameImmediate(elapsed) {
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        applyView(ctx);
+        ctx.drawImage(bgImage, 0, 0, W, H);
+        const lineEnd = firstDelayAbove(visible.lines, lineDelay, elapsed);
+        for (let j = 0; j < lineEnd; j++) {
+            const k = visible.lines[j];
+            if (lineVisible(k)) drawLine(ctx, k, Math.min(EDGE_ALPHA, (elapsed - col.line_delay[k]) / EDGE_FADE));
+        }
+        const labels = labelsOn(visible);
+        const nodeEnd = firstDelayAbove(visible.nodes, nodeDelay, elapsed);
+        for (let k = 0; k < nodeEnd; k++) {
+            const i = visible.nodes[k];
+            const a = nodeAlpha(i, elapsed);
+            if (isActive(i)) drawRipple(ctx, i, elapsed);
+            drawGlowArcs(ctx, i, a);
+            if (labels) drawLabel(ctx, i, a);
+        }
+        drawSelection(ctx, elapsed);
+    }
+
+    function frameLayered(elapsed) {
+        if (baked === null || (!sameView(baked.view, view) && performance.now() - viewChangedAt > SETTLE_MS)) bake();
+        advanceBake(elapsed);
+
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        blit(baked.edgeLayer);
+        // フェードイン中の線
+        const lineEnd = firstDelayAbove(visible.lines, lineDelay, elapsed);
+        for (let j = firstDelayAbove(visible.lines, lineDelay, elapsed - EDGE_SETTLE); j < lineEnd; j++) {
+            const k = visible.lines[j];
+            if (lineVisible(k)) drawLine(ctx, k, Math.min(EDGE_ALPHA, (elapsed - col.line_delay[k]) / EDGE_FADE));
+        }
+        // 波紋（表示済みのノードすべて）
+        const nodeEnd = firstDelayAbove(visible.nodes, nodeDelay, elapsed);
+        for (let k = 0; k < nodeEnd; k++) {
+            const i = visible.nodes[k];
+            if (isActive(i)) drawRipple(ctx, i, elapsed);
+        }
+        blit(baked.nodeLayer);
+        // フェードイン中のノード
+        const labels = labelsOn(visible);
+        for (let k = firstDelayAbove(visible.nodes, nodeDelay, elapsed - NODE_FADE); k < nodeEnd; k++) {
+            const i = visible.nodes[k];
+            const a = nodeAlpha(i, elapsed);
+            drawGlowSprite(ctx, i, a);
+            if (labels) drawLabel(ctx, i, a);
+        }
+        drawSelection(ctx, elapsed);
+    }
+
+    return {
+        px: px, py: py,
+        setView(scale, x, y) {
+            if (scale !== view.scale || x !== view.x || y !== view.y) {
+                view = { scale: scale, x: x, y: y };
+                viewChangedAt = performance.now();
+                visible = index.visible(view, CULL_MARGIN);
+            }
+        },
+        setActiveColors(colors) {
+            if (JSON.stringify(colors) !== JSON.stringify(activeColors)) {
+                activeColors = colors.slice();
+                paletteActive = palette.map(c => activeColors.length === 0 || activeColors.includes(c));
+                baked = null;
+            }
+        },
+        setSelected(node) { selectedNode = node; },
+        // 画面座標（scale=1 基準）の (x, y) から radius 以内で最も近いノード
+        pick(x, y, radius) {
+            const i = index.grid.nearest(x, y, radius);
+            return i < 0 ? null : data.node(i);
+        },
+        frame(elapsed) {
+            if (mode === "immediate") frameImmediate(elapsed);
+            else frameLayered(elapsed);
+        }
+    };
+}
@@ -0,0 +1,74 @@
+// Loads and decodes the animation payload published by app.py.
+//
+// app.py serves the dataset from static/ under content-hashed names and only
+// hands the views a small manifest ({format, url, gifts_url}). Binary
+// payloads (see write_animation_binary in gen_animation.py) are wrapped in
+// Float32Array/Int32Array views over one buffer instead of parsing one JSON
+// object per node; JSON payloads are converted to the same columns.
+
+// app/static/... はStreamlitページからの相対パスなので親ページのURLで解決する
+function assetUrl(path) {
+    let base = document.referrer || window.location.href;
+    try { base = window.parent.location.href; } catch (e) {}
+    return new URL(path, base).href;
+}
+
+// .gz の資産はブラウザ側で展開する（静的配信は圧縮しないため）
+async function fetchAsset(path) {
+    const res = await fetch(assetUrl(path));
+    if (!res.ok) throw new Error("failed to load " + path + ": " + res.status);
+    if (!path.endsWith(".gz")) return res.arrayBuffer();
+    return new Response(res.body.pipeThrough(new DecompressionStream("gzip"))).arrayBuffer();
+}
+
+async function fetchAnimation(manifest) {
+    const t0 = performance.now();
+    const parts = await Promise.all([fetchAsset(manifest.url), manifest.gifts_url ? fetchAsset(manifest.gifts_url) : null]);
+    console.info("animation payload (" + manifest.format + ") fetched in " + (performance.now() - t0).toFixed(2) + " ms");
+    const text = buf => new TextDecoder().decode(buf);
+    if (manifest.format === "binary") return decodeAnimation({ format: "binary", bytes: parts[0], gifts: JSON.parse(text(parts[1])) });
+    return decodeAnimation({ format: "json", data: JSON.parse(text(parts[0])) });
+}
+
+// どちらの形式も列（型付き配列）にそろえて返す。レンダラーは columns だけを読み、
+// ノードのオブジェクトは選択されたものだけ node(i) で作る
+function decodeAnimation(p) {
+    const t0 = performance.now();
+    let data;
+    if (p.format === "binary") {
+        const bytes = new Uint8Array(p.bytes);
+        const headerLen = new DataView(bytes.buffer).getUint32(4, true);
+        const header = JSON.parse(new TextDecoder().decode(bytes.subarray(8, 8 + headerLen)));
+        const types = { float32: Float32Array, int32: Int32Array, uint8: Uint8Array };
+        const col = {};
+        for (const [name, a] of Object.entries(header.arrays)) col[name] = new types[a.dtype](bytes.buffer, a.offset, a.length);
+        const names = col.x.length ? new TextDecoder().decode(col.names).split("\x1f") : [];
+        delete col.names;
+        data = { count: col.x.length, columns: col, names: names, gifts: p.gifts, palette: header.palette, config: header.config };
+    } else {
+        const nodes = p.data.nodes, lines = p.data.lines;
+        const n = nodes.length, m = lines.length;
+        const palette = [...new Set(nodes.map(d => d.color))];
+        const paletteIndex = new Map(palette.map((c, k) => [c, k]));
+        const col = {
+            x: new Float32Array(n), y: new Float32Array(n), score: new Float32Array(n),
+            delay: new Int32Array(n), color: new Int32Array(n),
+            source: new Int32Array(m), target: new Int32Array(m), line_delay: new Int32Array(m)
+        };
+        for (let i = 0; i < n; i++) {
+            const d = nodes[i];
+            col.x[i] = d.x; col.y[i] = d.y; col.score[i] = d.score; col.delay[i] = d.delay;
+            col.color[i] = paletteIndex.get(d.color);
+        }
+        for (let k = 0; k < m; k++) {
+            col.source[k] = lines[k].source; col.target[k] = lines[k].target; col.line_delay[k] = lines[k].delay;
+        }
+        data = { count: n, columns: col, names: nodes.map(d => d.name), gifts: nodes.map(d => d.gift),
+                 palette: palette, config: p.data.config };
+    }
+    const col = data.columns;
+    data.node = i => ({ id: i, x: col.x[i], y: col.y[i], name: data.names[i], color: data.palette[col.color[i]],
+                        score: col.score[i], delay: col.delay[i], gift: data.gifts[i] });
+    console.info("animation payload (" + p.format + ") decoded in " + (performance.now() - t0).toFixed(2) + " ms");
+    return data;
+}
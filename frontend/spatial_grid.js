@@ -0,0 +1,140 @@
+// Uniform grid over projected node positions (screen space at scale 1).
+//
+// Points are bucketed once with a counting sort into a CSR layout
+// (cellStart/items), so rectangle queries and nearest-point picking only
+// touch the cells they overlap instead of scanning every node.
+function createSpatialGrid(px, py, cellSize) {
+    const n = px.length;
+    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+    for (let i = 0; i < n; i++) {
+        if (px[i] < minX) minX = px[i];
+        if (px[i] > maxX) maxX = px[i];
+        if (py[i] < minY) minY = py[i];
+        if (py[i] > maxY) maxY = py[i];
+    }
+    if (n === 0) { minX = minY = 0; maxX = maxY = 1; }
+    if (!cellSize) {
+        // 1セルあたり平均4点程度
+        cellSize = Math.max(4, Math.sqrt(((maxX - minX) * (maxY - minY) || 1) * 4 / Math.max(1, n)));
+    }
+    const cols = Math.max(1, Math.floor((maxX - minX) / cellSize) + 1);
+    const rows = Math.max(1, Math.floor((maxY - minY) / cellSize) + 1);
+    const cellOf = new Int32Array(n);
+    const cellStart = new Int32Array(cols * rows + 1);
+    for (let i = 0; i < n; i++) {
+        const c = Math.floor((px[i] - minX) / cellSize) * rows + Math.floor((py[i] - minY) / cellSize);
+        cellOf[i] = c;
+        cellStart[c + 1]++;
+    }
+    for (let c = 0; c < cols * rows; c++) cellStart[c + 1] += cellStart[c];
+    const fill = cellStart.slice(0, cols * rows);
+    const items = new Int32Array(n);
+    for (let i = 0; i < n; i++) items[fill[cellOf[i]]++] = i;
+
+    function colOf(x) { return Math.min(cols - 1, Math.max(0, Math.floor((x - minX) / cellSize))); }
+    function rowOf(y) { return Math.min(rows - 1, Math.max(0, Math.floor((y - minY) / cellSize))); }
+
+    return {
+        // 矩形 [x0, x1] x [y0, y1] 内の点のインデックスを out に追加する
+        query(x0, y0, x1, y1, out) {
+            out = out || [];
+            if (x1 < minX || x0 > maxX || y1 < minY || y0 > maxY) return out;
+            const c0 = colOf(x0), c1 = colOf(x1), r0 = rowOf(y0), r1 = rowOf(y1);
+            for (let c = c0; c <= c1; c++) {
+                for (let r = r0; r <= r1; r++) {
+                    const cell = c * rows + r;
+                    for (let k = cellStart[cell]; k < cellStart[cell + 1]; k++) {
+                        const i = items[k];
+                        if (px[i] >= x0 && px[i] <= x1 && py[i] >= y0 && py[i] <= y1) out.push(i);
+                    }
+                }
+            }
+            return out;
+        },
+        // (x, y) から半径 radius 以内で最も近い点。なければ -1
+        nearest(x, y, radius, accept) {
+            let best = -1, bestD = radius * radius;
+            const c0 = colOf(x - radius), c1 = colOf(x + radius), r0 = rowOf(y - radius), r1 = rowOf(y + radius);
+            for (let c = c0; c <= c1; c++) {
+                for (let r = r0; r <= r1; r++) {
+                    const cell = c * rows + r;
+                    for (let k = cellStart[cell]; k < cellStart[cell + 1]; k++) {
+                        const i = items[k];
+                        const d = (px[i] - x) ** 2 + (py[i] - y) ** 2;
+                        if (d < bestD && (!accept || accept(i))) { best = i; bestD = d; }
+                    }
+                }
+            }
+            return best;
+        }
+    };
+}
+
+// Delay-ordered view culling for the renderers.
+//
+// visible(view) returns the node and line indices that can appear inside the
+// current viewport, each sorted by delay, using the grid for nodes and a
+// per-source line list (lines are never longer than maxLen) for edges.
+// Nodes and lines are given as columns (see decodeAnimation).
+function createViewIndex(px, py, nodeDelay, source, target, lineDelay) {
+    const W = 800, H = 600;
+    const n = px.length, m = source.length;
+    const grid = createSpatialGrid(px, py);
+
+    const nodeOrder = Int32Array.from({ length: n }, (_, i) => i).sort((a, b) => nodeDelay[a] - nodeDelay[b]);
+    const lineOrder = Int32Array.from({ length: m }, (_, i) => i).sort((a, b) => lineDelay[a] - lineDelay[b]);
+    const nodeRank = new Int32Array(n), lineRank = new Int32Array(m);
+    for (let k = 0; k < n; k++) nodeRank[nodeOrder[k]] = k;
+    for (let k = 0; k < m; k++) lineRank[lineOrder[k]] = k;
+
+    // 始点ごとの線リスト（CSR）
+    const lineStart = new Int32Array(n + 1);
+    let maxLen = 0;
+    for (let k = 0; k < m; k++) {
+        const s = source[k], t = target[k];
+        lineStart[s + 1]++;
+        maxLen = Math.max(maxLen, Math.abs(px[s] - px[t]), Math.abs(py[s] - py[t]));
+    }
+    for (let i = 0; i < n; i++) lineStart[i + 1] += lineStart[i];
+    const fill = lineStart.slice(0, n);
+    const lineItems = new Int32Array(m);
+    for (let k = 0; k < m; k++) lineItems[fill[source[k]]++] = k;
+
+    return {
+        grid: grid,
+        visible(view, margin) {
+            const x0 = -view.x - margin, y0 = -view.y - margin;
+            const x1 = -view.x + W / view.scale + margin, y1 = -view.y + H / view.scale + margin;
+            const cand = grid.query(x0, y0, x1, y1, []);
+            const nodeRanks = new Int32Array(cand.length);
+            for (let k = 0; k < cand.length; k++) nodeRanks[k] = nodeRank[cand[k]];
+            nodeRanks.sort();
+
+            const sources = grid.query(x0 - maxLen, y0 - maxLen, x1 + maxLen, y1 + maxLen, []);
+            const ranks = [];
+            for (const s of sources) {
+                for (let k = lineStart[s]; k < lineStart[s + 1]; k++) {
+                    const e = lineItems[k], t = target[e];
+                    if (Math.max(px[s], px[t]) < x0 || Math.min(px[s], px[t]) > x1 ||
+                        Math.max(py[s], py[t]) < y0 || Math.min(py[s], py[t]) > y1) continue;
+                    ranks.push(lineRank[e]);
+                }
+            }
+            const lineRanks = Int32Array.from(ranks).sort();
+            return {
+                nodes: nodeRanks.map(r => nodeOrder[r]),
+                lines: lineRanks.map(r => lineOrder[r])
+            };
+        }
+    };
+}
+
+// list（delay昇順）の中で delayOf(list[k]) > t となる最初の k
+function firstDelayAbove(list, delayOf, t) {
+    let lo = 0, hi = list.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (delayOf(list[mid]) > t) hi = mid; else lo = mid + 1;
+    }
+    return lo;
+}
@@ -0,0 +1,134 @@
+// Interactive view as a bidirectional Streamlit component (index.html).
+//
+// The iframe stays alive across reruns. The dataset manifest and background
+// URL are only sent by Python while the component reports that it has not
+// loaded the current dataset_key; afterwards each render message carries
+// only small state (active colours, render mode), which is applied in place.
+// Selection changes are sent back to Python as the component value.
+(function () {
+    const FRAME_HEIGHT = 720;
+    // データの取得に失敗したときの試行回数（Python は同じ引数では再描画を送ってこないので、ここで取り直す）
+    const LOAD_RETRIES = 5;
+    const container = document.getElementById('container');
+
+    let data = null, bgImage = null, loadedKey = null, pendingKey = null;
+    let renderer = null, renderMode = null;
+    let activeColors = [], selectedNode = null;
+    let scale = 1, viewX = 0, viewY = 0, isDragging = false, lastX = 0, lastY = 0;
+
+    if (!window.sessionStorage.getItem('animStartTime')) window.sessionStorage.setItem('animStartTime', Date.now());
+    const startTime = parseInt(window.sessionStorage.getItem('animStartTime'));
+
+    // --- Streamlit とのメッセージ ---
+    function send(type, extra) {
+        window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, extra), "*");
+    }
+    function sendValue() {
+        const sel = selectedNode ? { id: selectedNode.id, name: selectedNode.name } : null;
+        send("streamlit:setComponentValue", { value: { loaded: loadedKey, selected: sel }, dataType: "json" });
+    }
+
+    function buildRenderer() {
+        // WebGLのコンテキストを持ったキャンバスは使い回せないので作り直す
+        container.innerHTML = "";
+        const canvas = document.createElement('canvas');
+        container.appendChild(canvas);
+        renderer = createRenderer(canvas, data, bgImage, renderMode);
+        renderer.setActiveColors(activeColors);
+    }
+
+    function load(args, attempt) {
+        attempt = attempt || 1;
+        const key = pendingKey = args.dataset_key;
+        const image = new Image();
+        image.src = assetUrl(args.background);
+        Promise.all([fetchAnimation(args.dataset), image.decode()]).then(([decoded]) => {
+            if (pendingKey !== key) return;  // その間に別のデータに切り替わった
+            data = decoded;
+            bgImage = image;
+            selectedNode = null;
+            loadedKey = key;
+            pendingKey = null;
+            buildRenderer();
+            sendValue();
+        }).catch(err => {
+            console.warn("failed to load dataset " + key + " (attempt " + attempt + "): " + err.message);
+            if (pendingKey !== key) return;
+            if (attempt < LOAD_RETRIES) {
+                setTimeout(() => { if (pendingKey === key) load(args, attempt + 1); }, 2000 * attempt);
+            } else {
+                // 諦めたら読み込み中の印を外し、次の描画メッセージで読み直せるようにする
+                pendingKey = null;
+            }
+        });
+    }
+
+    function onRender(args) {
+        activeColors = args.active_colors || [];
+        if (args.dataset_key !== loadedKey) {
+            if (args.dataset_key === pendingKey) return;  // 読み込み中
+            if (args.dataset) {
+                renderMode = args.render_mode;
+                load(args);
+            } else {
+                // データを持っていない（ページ再読み込みなど）ので送り直してもらう
+                loadedKey = null;
+                sendValue();
+            }
+            return;
+        }
+        if (args.render_mode !== renderMode) {
+            renderMode = args.render_mode;
+            buildRenderer();
+        }
+        renderer.setActiveColors(activeColors);
+    }
+
+    window.addEventListener('message', e => {
+        if (e.data && e.data.type === "streamlit:render") onRender(e.data.args);
+    });
+
+    // マウス操作とクリック判定
+    container.addEventListener('mousedown', e => { isDragging = true; lastX = e.clientX; lastY = e.clientY; });
+    window.addEventListener('mouseup', () => isDragging = false);
+    window.addEventListener('mousemove', e => {
+        if (isDragging) {
+            viewX += (e.clientX - lastX) / scale; viewY += (e.clientY - lastY) / scale;
+            lastX = e.clientX; lastY = e.clientY;
+        }
+    });
+    container.addEventListener('wheel', e => {
+        if (e.ctrlKey) { e.preventDefault(); const z = e.deltaY > 0 ? 0.9 : 1.1; scale = Math.min(Math.max(1, scale * z), 10); }
+    }, { passive: false });
+
+    // クリック・ホバー判定はグリッドで近傍のセルだけを見る
+    function pickAt(e) {
+        if (!renderer) return null;
+        const rect = container.getBoundingClientRect();
+        const mx = (e.clientX - rect.left) / scale - viewX;
+        const my = (e.clientY - rect.top) / scale - viewY;
+        return renderer.pick(mx, my, 15 / scale);
+    }
+    container.addEventListener('click', e => {
+        const found = pickAt(e);
+        // pick は呼ぶたびに新しいオブジェクトを返すので id で比べる
+        selectedNode = (found && selectedNode && selectedNode.id === found.id) ? null : found;
+        sendValue();
+    });
+    container.addEventListener('mousemove', e => {
+        if (!isDragging) container.style.cursor = pickAt(e) ? 'pointer' : 'crosshair';
+    });
+
+    function loop() {
+        if (renderer) {
+            renderer.setView(scale, viewX, viewY);
+            renderer.setSelected(selectedNode);
+            renderer.frame((Date.now() - startTime) / 50);
+        }
+        requestAnimationFrame(loop);
+    }
+    requestAnimationFrame(loop);
+
+    send("streamlit:componentReady", { apiVersion: 1 });
+    send("streamlit:setFrameHeight", { height: FRAME_HEIGHT });
+})();
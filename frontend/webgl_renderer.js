@@ -0,0 +1,376 @@
+// WebGL2 renderer for large respondent counts (no external libraries).
+//
+// Edges are one batched gl.LINES draw; ripples and glows are instanced quads
+// whose fade-in and ripple phase are computed in the shaders from each
+// node's delay/score, so a frame is a handful of draw calls regardless of N.
+// Labels and the selection popup go on a 2D overlay canvas; settled labels
+// are cached in an offscreen layer like the Canvas2D "layered" mode, culled
+// to the viewport and shown only when at most LABEL_BUDGET nodes are in view.
+// Geometry outside the viewport is left to GPU clipping.
+//
+// Exposes the same interface as createCanvasRenderer. createWebGLRenderer
+// returns null when WebGL2 is unavailable; createRenderer falls back to
+// Canvas2D in that case.
+function createWebGLRenderer(canvas, data, bgImage) {
+    const W = 800, H = 600;
+    const EDGE_ALPHA = 0.4, EDGE_FADE = 320, NODE_FADE = 120, RIPPLE_PERIOD = 640;
+    const GLOW_RADIUS = 24;
+    const CULL_MARGIN = 40, SETTLE_MS = 150, LABEL_BUDGET = 400;
+
+    const probe = document.createElement('canvas').getContext('webgl2');
+    if (!probe) return null;
+    const gl = canvas.getContext('webgl2', { premultipliedAlpha: true, antialias: true });
+    if (!gl) return null;
+
+    const dpr = window.devicePixelRatio || 1;
+    canvas.width = W * dpr; canvas.height = H * dpr;
+    canvas.style.width = W + 'px'; canvas.style.height = H + 'px';
+
+    // ラベル用の2Dオーバーレイ（マウスイベントは下のキャンバスへ通す）
+    const wrap = document.createElement('div');
+    wrap.style.position = 'relative'; wrap.style.width = W + 'px'; wrap.style.height = H + 'px';
+    canvas.parentNode.insertBefore(wrap, canvas);
+    wrap.appendChild(canvas);
+    const overlay = document.createElement('canvas');
+    overlay.width = W * dpr; overlay.height = H * dpr;
+    overlay.style.cssText = `position:absolute;left:0;top:0;width:${W}px;height:${H}px;pointer-events:none;`;
+    wrap.appendChild(overlay);
+    const octx = overlay.getContext('2d');
+
+    const col = data.columns, palette = data.palette;
+    const n = data.count, m = col.source.length;
+    const px = new Float32Array(n), py = new Float32Array(n);
+    for (let i = 0; i < n; i++) {
+        px[i] = 100 + ((col.x[i] + 500) / 1000) * 600;
+        py[i] = 600 * (1 - (col.y[i] + 500) / 1000);
+    }
+    const index = createViewIndex(px, py, col.delay, col.source, col.target, col.line_delay);
+    const nodeDelay = i => col.delay[i];
+
+    // --- シェーダー ---
+    const VIEW_GLSL = `
+        uniform vec3 u_view;   // scale, viewX, viewY
+        vec4 toClip(vec2 p) {
+            vec2 s = u_view.x * (p + u_view.yz);
+            return vec4(s.x / ${W}.0 * 2.0 - 1.0, 1.0 - s.y / ${H}.0 * 2.0, 0.0, 1.0);
+        }`;
+    const BG_VS = `#version 300 es
+        in vec2 a_corner;
+        out vec2 v_uv;
+        ${VIEW_GLSL}
+        void main() { v_uv = a_corner; gl_Position = toClip(a_corner * vec2(${W}.0, ${H}.0)); }`;
+    const BG_FS = `#version 300 es
+        precision highp float;
+        uniform sampler2D u_tex;
+        in vec2 v_uv;
+        out vec4 o;
+        void main() { o = texture(u_tex, v_uv); }`;
+    const EDGE_VS = `#version 300 es
+        in vec2 a_pos;
+        in float a_delay;
+        in float a_visible;
+        uniform float u_elapsed;
+        out float v_alpha;
+        ${VIEW_GLSL}
+        void main() {
+            float t = u_elapsed - a_delay;
+            v_alpha = (t >= 0.0) ? min(${EDGE_ALPHA}, t / ${EDGE_FADE}.0) * a_visible : 0.0;
+            gl_Position = toClip(a_pos);
+        }`;
+    const EDGE_FS = `#version 300 es
+        precision highp float;
+        in float v_alpha;
+        out vec4 o;
+        void main() { if (v_alpha <= 0.0) discard; o = vec4(v_alpha); }`;
+    // 波紋と光彩はどちらもノードごとのインスタンス四角形
+    const NODE_VS = `#version 300 es
+        in vec2 a_corner;      // -1..1
+        in vec2 a_center;
+        in float a_delay;
+        in float a_score;
+        in vec3 a_color;
+        in float a_active;     // 1: フィルター対象, 0: 非選択
+        uniform float u_elapsed;
+        uniform float u_ripple; // 1: 波紋, 0: 光彩
+        out vec2 v_local;
+        out float v_t;
+        out float v_score;
+        out vec3 v_color;
+        out float v_active;
+        ${VIEW_GLSL}
+        void main() {
+            v_t = u_elapsed - a_delay;
+            v_score = a_score;
+            v_color = a_color;
+            v_active = a_active;
+            float radius = u_ripple > 0.5 ? a_score * 2.7 + 3.0 / u_view.x : ${GLOW_RADIUS}.0;
+            // 未表示のノードは画面外へ
+            if (v_t < 0.0 || (u_ripple > 0.5 && a_active < 0.5)) { gl_Position = vec4(2.0, 2.0, 2.0, 1.0); return; }
+            v_local = a_corner * radius;
+            gl_Position = toClip(a_center + v_local);
+        }`;
+    const NODE_FS = `#version 300 es
+        precision highp float;
+        in vec2 v_local;
+        in float v_t;
+        in float v_score;
+        in vec3 v_color;
+        in float v_active;
+        uniform float u_ripple;
+        uniform float u_pixel;  // ワールド座標での1デバイスピクセル
+        uniform vec3 u_view;
+        out vec4 o;
+        float disc(float d, float r) { return clamp((r - d) / u_pixel + 0.5, 0.0, 1.0); }
+        void main() {
+            float d = length(v_local);
+            if (u_ripple > 0.5) {
+                float p = mod(v_t, ${RIPPLE_PERIOD}.0) / ${RIPPLE_PERIOD}.0;
+                float r = p * v_score * 4.5 / 1000.0 * 600.0;
+                float half_w = 1.5 / u_view.x;
+                float cover = clamp((half_w - abs(d - r)) / u_pixel + 0.5, 0.0, 1.0);
+                float a = cover * clamp(1.2 * (1.0 - p), 0.0, 1.0);
+                if (a <= 0.0) discard;
+                o = vec4(v_color * a, a);
+            } else {
+                float fade = (v_active > 0.5 ? 1.0 : 0.1) * min(1.0, v_t / ${NODE_FADE}.0);
+                float a = 1.0 - (1.0 - fade * 0.075 * disc(d, ${GLOW_RADIUS}.0))
+                              * (1.0 - fade * 0.2 * disc(d, 8.0))
+                              * (1.0 - fade * 0.9 * disc(d, 3.0));
+                if (a <= 0.0) discard;
+                o = vec4(a, a, a, a);
+            }
+        }`;
+
+    function compile(type, src) {
+        const s = gl.createShader(type);
+        gl.shaderSource(s, src); gl.compileShader(s);
+        if (!gl.getShaderParameter(s, gl.COMPILE_STATUS)) throw new Error(gl.getShaderInfoLog(s));
+        return s;
+    }
+    function program(vs, fs) {
+        const p = gl.createProgram();
+        gl.attachShader(p, compile(gl.VERTEX_SHADER, vs));
+        gl.attachShader(p, compile(gl.FRAGMENT_SHADER, fs));
+        gl.linkProgram(p);
+        if (!gl.getProgramParameter(p, gl.LINK_STATUS)) throw new Error(gl.getProgramInfoLog(p));
+        return p;
+    }
+    function buffer(arr) {
+        const b = gl.createBuffer();
+        gl.bindBuffer(gl.ARRAY_BUFFER, b);
+        gl.bufferData(gl.ARRAY_BUFFER, arr, gl.STATIC_DRAW);
+        return b;
+    }
+    function attrib(prog, name, buf, size, divisor) {
+        const loc = gl.getAttribLocation(prog, name);
+        if (loc < 0) return;
+        gl.bindBuffer(gl.ARRAY_BUFFER, buf);
+        gl.enableVertexAttribArray(loc);
+        gl.vertexAttribPointer(loc, size, gl.FLOAT, false, 0, 0);
+        gl.vertexAttribDivisor(loc, divisor);
+    }
+    function hexToRgb(hex) {
+        const v = parseInt(hex.slice(1), 16);
+        return [((v >> 16) & 255) / 255, ((v >> 8) & 255) / 255, (v & 255) / 255];
+    }
+
+    const bgProg = program(BG_VS, BG_FS);
+    const edgeProg = program(EDGE_VS, EDGE_FS);
+    const nodeProg = program(NODE_VS, NODE_FS);
+
+    // 背景
+    const quad = buffer(new Float32Array([0, 0, 1, 0, 0, 1, 1, 1]));
+    const bgVao = gl.createVertexArray();
+    gl.bindVertexArray(bgVao);
+    attrib(bgProg, 'a_corner', quad, 2, 0);
+    const bgTex = gl.createTexture();
+    gl.bindTexture(gl.TEXTURE_2D, bgTex);
+    gl.pixelStorei(gl.UNPACK_PREMULTIPLY_ALPHA_WEBGL, true);
+    gl.texImage2D(gl.TEXTURE_2D, 0, gl.RGBA, gl.RGBA, gl.UNSIGNED_BYTE, bgImage);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_MIN_FILTER, gl.LINEAR);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_MAG_FILTER, gl.LINEAR);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_WRAP_S, gl.CLAMP_TO_EDGE);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_WRAP_T, gl.CLAMP_TO_EDGE);
+
+    // 線（2頂点/本を1回の drawArrays で描く）
+    const edgePos = new Float32Array(m * 4), edgeDelay = new Float32Array(m * 2);
+    for (let k = 0; k < m; k++) {
+        const s = col.source[k], t = col.target[k];
+        edgePos[k * 4] = px[s]; edgePos[k * 4 + 1] = py[s]; edgePos[k * 4 + 2] = px[t]; edgePos[k * 4 + 3] = py[t];
+        edgeDelay[k * 2] = edgeDelay[k * 2 + 1] = col.line_delay[k];
+    }
+    const edgeVisible = new Float32Array(m * 2).fill(1);
+    const edgeVisibleBuf = buffer(edgeVisible);
+    const edgeVao = gl.createVertexArray();
+    gl.bindVertexArray(edgeVao);
+    attrib(edgeProg, 'a_pos', buffer(edgePos), 2, 0);
+    attrib(edgeProg, 'a_delay', buffer(edgeDelay), 1, 0);
+    attrib(edgeProg, 'a_visible', edgeVisibleBuf, 1, 0);
+
+    // ノード（インスタンス属性）
+    const center = new Float32Array(n * 2), delay = Float32Array.from(col.delay), color = new Float32Array(n * 3);
+    const paletteRgb = palette.map(hexToRgb);
+    for (let i = 0; i < n; i++) {
+        center[i * 2] = px[i]; center[i * 2 + 1] = py[i];
+        color.set(paletteRgb[col.color[i]], i * 3);
+    }
+    const active = new Float32Array(n).fill(1);
+    const activeBuf = buffer(active);
+    const nodeVao = gl.createVertexArray();
+    gl.bindVertexArray(nodeVao);
+    attrib(nodeProg, 'a_corner', buffer(new Float32Array([-1, -1, 1, -1, -1, 1, 1, 1])), 2, 0);
+    attrib(nodeProg, 'a_center', buffer(center), 2, 1);
+    attrib(nodeProg, 'a_delay', buffer(delay), 1, 1);
+    attrib(nodeProg, 'a_score', buffer(col.score), 1, 1);
+    attrib(nodeProg, 'a_color', buffer(color), 3, 1);
+    attrib(nodeProg, 'a_active', activeBuf, 1, 1);
+    gl.bindVertexArray(null);
+
+    gl.enable(gl.BLEND);
+    // シェーダーの出力はすべてプリマルチプライド済み
+    gl.blendFunc(gl.ONE, gl.ONE_MINUS_SRC_ALPHA);
+
+    let view = { scale: 1, x: 0, y: 0 }, viewChangedAt = 0;
+    let visible = index.visible(view, CULL_MARGIN);
+    // パレットの色ごとにフィルター対象かどうか
+    let activeColors = [], paletteActive = palette.map(() => true);
+    let selectedNode = null;
+    // 焼き込み済みラベル（baked.view の表示状態）
+    let baked = null;
+
+    function isActive(i) {
+        return paletteActive[col.color[i]];
+    }
+    function applyView(c) {
+        const s = dpr * view.scale;
+        c.setTransform(s, 0, 0, s, s * view.x, s * view.y);
+    }
+    function drawLabel(c, i, a) {
+        c.fillStyle = "rgba(255,255,255," + (a * 0.7) + ")"; c.font = `bold ${9 / view.scale}px sans-serif`;
+        c.fillText(data.names[i], px[i] + 8 / view.scale, py[i] - 5 / view.scale);
+    }
+    function labelAlpha(i, elapsed) {
+        return (isActive(i) ? 1 : 0.1) * Math.min(1, (elapsed - col.delay[i]) / NODE_FADE);
+    }
+    function drawSelection(c, elapsed) {
+        const n = selectedNode;
+        if (n === null || !n.gift || elapsed < n.delay) return;
+        const i = n.id, x = px[i], y = py[i], s = view.scale;
+        c.font = `bold ${10 / s}px sans-serif`;
+        const tw = c.measureText(n.gift).width;
+        const bx = x - tw - 15 / s, by = y - 15 / s;
+        c.beginPath(); c.moveTo(x - 4 / s, y - 4 / s); c.lineTo(bx + tw, by + 2 / s);
+        c.strokeStyle = "rgba(255, 255, 255, 0.7)"; c.lineWidth = 1 / s; c.stroke();
+        c.fillStyle = "white"; c.textAlign = "left"; c.fillText(n.gift, bx, by);
+        c.beginPath(); c.moveTo(bx, by + 2 / s); c.lineTo(bx + tw, by + 2 / s);
+        c.strokeStyle = "rgba(255, 255, 255, 0.9)"; c.lineWidth = 1 / s; c.stroke();
+    }
+    function drawOverlay(elapsed) {
+        const sameView = baked !== null && baked.view.scale === view.scale && baked.view.x === view.x && baked.view.y === view.y;
+        if (baked === null || (!sameView && performance.now() - viewChangedAt > SETTLE_MS)) {
+            baked = { view: view, visible: visible, labels: visible.nodes.length <= LABEL_BUDGET,
+                      layer: document.createElement('canvas'), settled: 0 };
+            baked.layer.width = overlay.width; baked.layer.height = overlay.height;
+            applyView(baked.layer.getContext('2d'));
+        }
+        const vis = baked.visible, lc = baked.layer.getContext('2d');
+        while (baked.labels && baked.settled < vis.nodes.length && col.delay[vis.nodes[baked.settled]] + NODE_FADE <= elapsed) {
+            const i = vis.nodes[baked.settled++];
+            drawLabel(lc, i, labelAlpha(i, elapsed));
+        }
+        const v0 = baked.view, k = view.scale / v0.scale;
+        octx.setTransform(1, 0, 0, 1, 0, 0);
+        octx.clearRect(0, 0, overlay.width, overlay.height);
+        octx.setTransform(dpr * k, 0, 0, dpr * k, dpr * view.scale * (view.x - v0.x), dpr * view.scale * (view.y - v0.y));
+        octx.drawImage(baked.layer, 0, 0, W, H);
+        applyView(octx);
+        if (visible.nodes.length <= LABEL_BUDGET) {
+            const end = firstDelayAbove(visible.nodes, nodeDelay, elapsed);
+            for (let j = firstDelayAbove(visible.nodes, nodeDelay, elapsed - NODE_FADE); j < end; j++) {
+                const i = visible.nodes[j];
+                drawLabel(octx, i, labelAlpha(i, elapsed));
+            }
+        }
+        drawSelection(octx, elapsed);
+    }
+
+    function setUniforms(prog, elapsed) {
+        gl.useProgram(prog);
+        gl.uniform3f(gl.getUniformLocation(prog, 'u_view'), view.scale, view.x, view.y);
+        const e = gl.getUniformLocation(prog, 'u_elapsed');
+        if (e) gl.uniform1f(e, elapsed);
+    }
+
+    return {
+        px: px, py: py,
+        setView(scale, x, y) {
+            if (scale !== view.scale || x !== view.x || y !== view.y) {
+                view = { scale: scale, x: x, y: y };
+                viewChangedAt = performance.now();
+                visible = index.visible(view, CULL_MARGIN);
+            }
+        },
+        setActiveColors(colors) {
+            if (JSON.stringify(colors) === JSON.stringify(activeColors)) return;
+            activeColors = colors.slice();
+            paletteActive = palette.map(c => activeColors.length === 0 || activeColors.includes(c));
+            for (let i = 0; i < n; i++) active[i] = isActive(i) ? 1 : 0;
+            for (let k = 0; k < m; k++) {
+                const v = (activeColors.length === 0 || active[col.source[k]] || active[col.target[k]]) ? 1 : 0;
+                edgeVisible[k * 2] = edgeVisible[k * 2 + 1] = v;
+            }
+            gl.bindBuffer(gl.ARRAY_BUFFER, activeBuf); gl.bufferSubData(gl.ARRAY_BUFFER, 0, active);
+            gl.bindBuffer(gl.ARRAY_BUFFER, edgeVisibleBuf); gl.bufferSubData(gl.ARRAY_BUFFER, 0, edgeVisible);
+            baked = null;
+        },
+        setSelected(node) { selectedNode = node; },
+        pick(x, y, radius) {
+            const i = index.grid.nearest(x, y, radius);
+            return i < 0 ? null : data.node(i);
+        },
+        frame(elapsed) {
+            gl.viewport(0, 0, canvas.width, canvas.height);
+            gl.clearColor(0, 0, 0, 0);
+            gl.clear(gl.COLOR_BUFFER_BIT);
+
+            setUniforms(bgProg, elapsed);
+            gl.bindVertexArray(bgVao);
+            gl.bindTexture(gl.TEXTURE_2D, bgTex);
+            gl.drawArrays(gl.TRIANGLE_STRIP, 0, 4);
+
+            setUniforms(edgeProg, elapsed);
+            gl.bindVertexArray(edgeVao);
+            gl.drawArrays(gl.LINES, 0, m * 2);
+
+            setUniforms(nodeProg, elapsed);
+            gl.uniform1f(gl.getUniformLocation(nodeProg, 'u_pixel'), 1 / (dpr * view.scale));
+            gl.bindVertexArray(nodeVao);
+            gl.uniform1f(gl.getUniformLocation(nodeProg, 'u_ripple'), 1);
+            gl.drawArraysInstanced(gl.TRIANGLE_STRIP, 0, 4, n);
+            gl.uniform1f(gl.getUniformLocation(nodeProg, 'u_ripple'), 0);
+            gl.drawArraysInstanced(gl.TRIANGLE_STRIP, 0, 4, n);
+            gl.bindVertexArray(null);
+
+            drawOverlay(elapsed);
+        }
+    };
+}
+
+// 描画モードに応じてレンダラーを作る。WebGLが使えなければCanvas2Dに切り替える
+function createRenderer(canvas, data, bgImage, mode) {
+    if (mode === "webgl") {
+        try {
+            const r = createWebGLRenderer(canvas, data, bgImage);
+            if (r) return r;
+        } catch (err) {
+            console.warn("WebGL renderer failed: " + err.message);
+            // 一度WebGLコンテキストを取ったキャンバスは2Dに使えないので差し替える
+            const fresh = canvas.cloneNode(false);
+            canvas.replaceWith(fresh);
+            canvas = fresh;
+        }
+        console.warn("WebGL unavailable, falling back to Canvas2D");
+        mode = "layered";
+    }
+    return createCanvasRenderer(canvas, data, bgImage, { mode: mode });
+}
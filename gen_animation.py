@@ -1,20 +1,822 @@
 import numpy as np
 import pandas as pd
+import hashlib
 import json
 import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import pyarrow as pa
+import pyarrow.feather
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
 import matplotlib.patches as patches
+from matplotlib import font_manager
+from matplotlib.collections import LineCollection, EllipseCollection
+from PIL import Image, ImageDraw, ImageFont
 
 # Use a default font that supports Japanese if possible, or fallback
 plt.rcParams['font.family'] = 'Meiryo'
 
+# 線を引く距離の閾値
+EDGE_THRESHOLD = 160
 
+# 近傍探索のチャンクサイズ（候補ペア生成時のメモリ上限）
+EDGE_CHUNK_SIZE = 4096
 
-def generate_exact_static_image(df, x, y, star_colors, scores, names, output_path='static_network_glow.png', show_lines=True):
+# 静止画の描画設定
+RENDER_MODES = ("batched", "legacy")
+STATIC_DPI = 300
+STATIC_SIZE_INCHES = 10
+# これを超えるノード数では名前ラベルを間引く
+MAX_LABELS = 500
+
+# 出力形式: JSON（互換用）とカラム型バイナリ
+OUTPUT_FORMATS = ("both", "binary", "json")
+BINARY_MAGIC = b"FMAN"
+BINARY_VERSION = 1
+# 名前の区切り文字（改行を含む名前でも壊れないように）
+NAME_SEPARATOR = "\x1f"
+
+# 色設定（Q4_Switch の値 → 色）。この並びが出現順でもある
+COLOR_MAP = {
+    "安心": "#0ea5e9", "挑戦": "#f97316", "確信": "#eab308",
+    "充足": "#4ade80", "静観": "#ffffff"
+}
+SWITCH_ORDER = tuple(COLOR_MAP)
+DEFAULT_COLOR = "#ffffff"
+PALETTE = list(dict.fromkeys(list(COLOR_MAP.values()) + [DEFAULT_COLOR]))
+# 出現順位1つあたりの遅延フレーム数（約100人で 0〜2800 フレームに広がる）
+DELAY_STEP = 28
+
+# ノード配置
+# random: 一様乱数（従来） / clustered: カテゴリーごとの塊 / force: 力学モデル（Barnes-Hut）
+LAYOUT_MODES = ("random", "clustered", "force")
+LAYOUT_SEED = 42
+# 背景は -500〜500、ノードは -400〜400 の範囲に置く
+CONTENT_MIN, CONTENT_MAX = -400, 400
+LAYOUT_ITERATIONS = 50
+# 中心への引力（弱いと塊が離れすぎ、縮めて表示したときに小さく潰れる）
+LAYOUT_GRAVITY = 1.0
+# Barnes-Hut の近似の粗さ（セル幅 / 距離 がこれ未満なら重心で近似）
+BH_THETA = 1.2
+# 一度に木をたどるノード数（候補ペアのメモリ上限）
+BH_CHUNK = 4096
+# 似た回答（同じカテゴリーでQ2の近い回答者）同士を引き合わせる辺の数と範囲
+SIMILARITY_LINKS = 3
+SIMILARITY_WINDOW = 32
+
+# 差分再生成用の前回状態（名前・回答ごとの位置と線）
+STATE_VERSION = 2
+
+# アンケートCSVの必須列と、取り込み時の型付きキャッシュ
+REQUIRED_COLUMNS = ("Name", "Q2", "Q4_Switch", "Q6_Gift")
+SURVEY_CACHE_PATH = "survey_data.feather"
+# 取り込み時に一度に読む行数（メモリ上限）
+INGEST_CHUNK_ROWS = 100_000
+# キャッシュのスキーマに記録する元CSVのハッシュのキー
+SURVEY_SOURCE_KEY = "source_sha256"
+
+# 生成ジョブの進捗ステージ（この順に進む）
+JOB_STAGES = ("layout", "edges", "json", "png", "done")
+
+ANIMATION_CONFIG = {
+    "limit_min": -500,
+    "limit_max": 500,
+    "duration_frames": 4000,
+    "fps": 20
+}
+
+# 動画書き出し（canvas_renderer.js と同じタイムライン。elapsed 1 = 1フレーム）
+CANVAS_SIZE = (800, 600)
+EDGE_ALPHA, EDGE_FADE, NODE_FADE, RIPPLE_PERIOD = 0.4, 320, 120, 640
+# 線のアルファは EDGE_ALPHA で頭打ちになるので、それ以降は背景に焼き込める
+EDGE_SETTLE = EDGE_ALPHA * EDGE_FADE
+GLOW_RINGS = ((24, 0.075), (8, 0.2), (3, 0.9))
+LABEL_BUDGET = 400
+# ワーカー1つあたりのタスク数（フレーム範囲の分割数。遅い範囲の偏りをならす）
+EXPORT_TASKS_PER_WORKER = 4
+
+
+def build_edges(x, y, appearance_delay, threshold=EDGE_THRESHOLD):
+    """Find all pairs closer than ``threshold`` using a uniform grid.
+
+    Returns ``(source, target, delay)`` int arrays ordered exactly like the
+    original ``for i / for j`` loop (source ascending, then target).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    delays = np.asarray(appearance_delay, dtype=np.int64)
+    num_stars = len(x)
+    empty = np.zeros(0, dtype=np.int64)
+    if num_stars < 2 or threshold <= 0:
+        return empty, empty.copy(), empty.copy()
+
+    # セルサイズ = 閾値 なので、近傍は隣接セルにしか存在しない
+    cx = np.floor((x - x.min()) / threshold).astype(np.int64)
+    cy = np.floor((y - y.min()) / threshold).astype(np.int64)
+    ny = int(cy.max()) + 2
+    nx = int(cx.max()) + 2
+    cell = cx * ny + cy
+
+    # セルの範囲は問い合わせたセルだけ引く（閾値が小さいとセル数は膨大になる）
+    order = np.argsort(cell, kind='stable')
+    cell_sorted = cell[order]
+
+    # 自セル + 前方の隣接4セルだけを見る（各ペアを一度だけ数える）
+    offsets = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+    pos = np.arange(num_stars)
+    src_parts, dst_parts = [], []
+    for lo in range(0, num_stars, EDGE_CHUNK_SIZE):
+        p = pos[lo:lo + EDGE_CHUNK_SIZE]
+        pcx, pcy = cx[order[p]], cy[order[p]]
+        for dx, dy in offsets:
+            qx, qy = pcx + dx, pcy + dy
+            valid = (qx >= 0) & (qx < nx) & (qy >= 0) & (qy < ny)
+            pv = p[valid]
+            q = qx[valid] * ny + qy[valid]
+            begin = np.searchsorted(cell_sorted, q, side='left')
+            end = np.searchsorted(cell_sorted, q, side='right')
+            if dx == 0 and dy == 0:
+                # 同じセル内は並び順で後ろのものだけ
+                begin = pv + 1
+            counts = np.maximum(end - begin, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            a = np.repeat(pv, counts)
+            run_start = np.cumsum(counts) - counts
+            b = np.repeat(begin - run_start, counts) + np.arange(total)
+            i, j = order[a], order[b]
+            dist = np.sqrt((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2)
+            keep = dist < threshold
+            src_parts.append(i[keep])
+            dst_parts.append(j[keep])
+
+    if not src_parts:
+        return empty, empty.copy(), empty.copy()
+    i = np.concatenate(src_parts)
+    j = np.concatenate(dst_parts)
+    source = np.minimum(i, j)
+    target = np.maximum(i, j)
+    sort_idx = np.lexsort((target, source))
+    source, target = source[sort_idx], target[sort_idx]
+    delay = np.maximum(delays[source], delays[target])
+    return source, target, delay
+
+
+def build_edges_for(x, y, subset, threshold=EDGE_THRESHOLD):
+    """Find the pairs closer than ``threshold`` that involve a node in ``subset``.
+
+    Returns ``(source, target)`` with ``source < target``, sorted like
+    :func:`build_edges`. Used to add the edges of new nodes without
+    searching the pairs that already existed.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    subset = np.asarray(subset, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(x) < 2 or len(subset) == 0 or threshold <= 0:
+        return empty, empty.copy()
+
+    cx = np.floor((x - x.min()) / threshold).astype(np.int64)
+    cy = np.floor((y - y.min()) / threshold).astype(np.int64)
+    ny = int(cy.max()) + 2
+    nx = int(cx.max()) + 2
+    cell = cx * ny + cy
+    order = np.argsort(cell, kind='stable')
+    cell_sorted = cell[order]
+
+    # 対象ノードから周囲9セルをすべて見る
+    src_parts, dst_parts = [], []
+    for lo in range(0, len(subset), EDGE_CHUNK_SIZE):
+        i_all = subset[lo:lo + EDGE_CHUNK_SIZE]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                qx, qy = cx[i_all] + dx, cy[i_all] + dy
+                valid = (qx >= 0) & (qx < nx) & (qy >= 0) & (qy < ny)
+                iv = i_all[valid]
+                q = qx[valid] * ny + qy[valid]
+                begin = np.searchsorted(cell_sorted, q, side='left')
+                end = np.searchsorted(cell_sorted, q, side='right')
+                counts = end - begin
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                i = np.repeat(iv, counts)
+                run_start = np.cumsum(counts) - counts
+                j = order[np.repeat(begin - run_start, counts) + np.arange(total)]
+                dist = np.sqrt((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2)
+                keep = (dist < threshold) & (i != j)
+                src_parts.append(i[keep])
+                dst_parts.append(j[keep])
+
+    if not src_parts:
+        return empty, empty.copy()
+    i = np.concatenate(src_parts)
+    j = np.concatenate(dst_parts)
+    # 対象ノード同士のペアは両側から見つかるので一意にする
+    pairs = np.unique(np.minimum(i, j) * len(x) + np.maximum(i, j))
+    return pairs // len(x), pairs % len(x)
+
+
+@contextmanager
+def measure_stage(stats, name, trace_memory=False):
+    """Record ``{name}_sec`` (and ``{name}_peak_bytes`` when tracing) in ``stats``.
+
+    Does nothing when ``stats`` is None. tracemalloc slows code that creates
+    many Python objects considerably, so memory tracing is opt-in.
+    """
+    if stats is None:
+        yield
+        return
+    started = False
+    if trace_memory:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[f"{name}_sec"] = time.perf_counter() - t0
+        if trace_memory:
+            stats[f"{name}_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+
+
+def format_stats(stats):
+    """One line per measured stage, e.g. ``prep: 0.84s, peak 290.4 MiB``."""
+    lines = []
+    for key, sec in stats.items():
+        if not key.endswith("_sec"):
+            continue
+        name = key[:-len("_sec")]
+        line = f"{name}: {sec:.2f}s"
+        if f"{name}_peak_bytes" in stats:
+            line += f", peak {stats[name + '_peak_bytes'] / 2**20:,.1f} MiB"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def prepare_nodes(df):
+    """Build the per-node columns for ``df`` without modifying it.
+
+    Returns a dict with ``names`` (list), ``switch`` (index into
+    ``SWITCH_ORDER``, ``len(SWITCH_ORDER)`` for anything else), ``color``
+    (index into ``PALETTE``), ``score`` (float64) and ``delay`` (int64).
+    Delays rank nodes by switch, then ``Q2`` ascending, ties keeping row
+    order.
+    """
+    switch = pd.Categorical(df['Q4_Switch'], categories=SWITCH_ORDER).codes.astype(np.int64)
+    switch[switch < 0] = len(SWITCH_ORDER)
+    color_lookup = np.array([PALETTE.index(COLOR_MAP[k]) for k in SWITCH_ORDER] + [PALETTE.index(DEFAULT_COLOR)])
+    score = df['Q2'].to_numpy(dtype=float)
+
+    # lexsort は安定ソートなので同順位は行順のまま
+    order = np.lexsort((score, switch))
+    delay = np.empty(len(df), dtype=np.int64)
+    delay[order] = np.arange(len(df), dtype=np.int64) * DELAY_STEP
+    return {
+        "names": df['Name'].tolist(),
+        "switch": switch,
+        "color": color_lookup[switch],
+        "score": score,
+        "delay": delay,
+    }
+
+
+def answer_keys(names, scores, switches, gifts):
+    """Identify rows by name plus answers (``Q2``, ``Q4_Switch``, ``Q6_Gift``).
+
+    Rows that agree on all of these are told apart by their occurrence
+    among such rows.
+    """
+    keys = pd.Series(names, dtype=object).astype(str)
+    for part in (scores, switches, gifts):
+        keys = keys + NAME_SEPARATOR + pd.Series(part).astype(str).to_numpy(dtype=object)
+    # 名前も回答も同じ行は区別できないので出現順で分ける
+    occurrence = keys.groupby(keys, sort=False).cumcount().astype(str)
+    return (keys + NAME_SEPARATOR + occurrence).to_numpy(dtype=str)
+
+
+def match_previous_nodes(keys, names, scores, switches, gifts, state):
+    """Index of each row's node in the previous ``state``, -1 for new rows.
+
+    Rows are matched by name and answers (``keys`` from :func:`answer_keys`)
+    first. The rest are paired with a remaining previous node of the same
+    name, closest answers first (fewest differing answers, then nearest
+    ``Q2``), so editing, deleting or reordering one of several respondents
+    with the same name does not hand their node to another.
+    """
+    old_keys = answer_keys(state["names"], state["scores"], state["switches"], state["gifts"])
+    prev = pd.Index(old_keys).get_indexer(keys).astype(np.int64)
+    rows = np.flatnonzero(prev < 0)
+    if len(rows) == 0:
+        return prev
+    free = np.ones(len(old_keys), dtype=bool)
+    free[prev[prev >= 0]] = False
+    candidates = {}
+    for k in np.flatnonzero(free):
+        candidates.setdefault(str(state["names"][k]), []).append(k)
+    wanted = {}
+    for i in rows:
+        if str(names[i]) in candidates:
+            wanted.setdefault(str(names[i]), []).append(i)
+    for name, new_rows in wanted.items():
+        # 同名の残り同士で、回答の近い組から順に対応付ける
+        pairs = sorted(
+            ((int(state["switches"][k] != switches[i]) + int(state["gifts"][k] != gifts[i]) +
+              int(state["scores"][k] != scores[i]), abs(float(state["scores"][k]) - float(scores[i])), k, i)
+             for i in new_rows for k in candidates[name]))
+        used_old, used_new = set(), set()
+        for _, _, k, i in pairs:
+            if k not in used_old and i not in used_new:
+                prev[i] = k
+                used_old.add(k)
+                used_new.add(i)
+    return prev
+
+
+def cluster_centers(num_clusters, radius=250):
+    """Centres of the category clusters, evenly spaced on a circle."""
+    angle = 2 * np.pi * np.arange(num_clusters) / num_clusters - np.pi / 2
+    return np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+
+
+def clustered_offsets(rng, cluster_size, total):
+    """Gaussian offsets around each node's cluster centre; bigger clusters spread wider."""
+    spread = 40 + 80 * np.sqrt(np.asarray(cluster_size) / max(1, total))
+    return rng.normal(0, 1, (len(spread), 2)) * spread[:, None]
+
+
+def similarity_edges(switch, score, links=SIMILARITY_LINKS, window=SIMILARITY_WINDOW, seed=LAYOUT_SEED):
+    """Attraction graph for the force layout.
+
+    Each node is linked to ``links`` nodes of the same category at most
+    ``window`` places away in ``Q2`` order, so similar answers pull
+    together, plus ``links`` random nodes of the same category, so each
+    category forms one compact blob rather than a chain.
+    """
+    n = len(switch)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((score, switch))
+    # 並べ替え後の各ノードが属するカテゴリーの範囲
+    sorted_switch = switch[order]
+    first = np.searchsorted(sorted_switch, sorted_switch, side='left')
+    last = np.searchsorted(sorted_switch, sorted_switch, side='right') - 1
+    rank = np.repeat(np.arange(n), links)
+    near = np.minimum(rank + rng.integers(1, window + 1, len(rank)), last[rank])
+    anywhere = first[rank] + (rng.random(len(rank)) * (last[rank] - first[rank] + 1)).astype(np.int64)
+    a = order[np.concatenate([rank, rank])]
+    b = order[np.concatenate([near, anywhere])]
+    keep = a != b
+    return a[keep], b[keep]
+
+
+def barnes_hut_repulsion(pos, k2, theta=BH_THETA):
+    """Fruchterman-Reingold repulsion ``k2 / d`` from all other nodes.
+
+    Uses an implicit quadtree: for each level the occupied cells and their
+    mass/centre of mass come from ``np.unique``/``np.bincount``, and a chunk
+    of nodes walks the tree together as arrays of (node, cell) pairs. A cell
+    that is small relative to its distance (``size / d < theta``) is replaced
+    by its centre of mass; otherwise its children are visited, down to the
+    leaves, whose nodes are computed exactly.
+    """
+    n = len(pos)
+    lo = pos.min(axis=0)
+    size = float(max(np.ptp(pos[:, 0]), np.ptp(pos[:, 1]))) * (1 + 1e-9) + 1e-9
+    # 葉セルが平均1点未満になる深さ（子セルの表引き用の配列が大きくなりすぎない範囲で）
+    depth = int(np.clip(np.ceil(np.log2(np.sqrt(max(n, 1)))) + 1, 1, 11))
+    side = 1 << depth
+    cells = np.minimum(((pos - lo) / size * side).astype(np.int64), side - 1)
+
+    levels = []
+    for level in range(depth + 1):
+        shift = depth - level
+        code = (cells[:, 0] >> shift) * (1 << level) + (cells[:, 1] >> shift)
+        codes, owner = np.unique(code, return_inverse=True)
+        mass = np.bincount(owner, minlength=len(codes)).astype(float)
+        com = np.column_stack([np.bincount(owner, pos[:, 0], len(codes)),
+                               np.bincount(owner, pos[:, 1], len(codes))]) / mass[:, None]
+        # セル番号 → 占有セルの添字（空セルは -1）
+        lookup = np.full(1 << (2 * level), -1, dtype=np.int64)
+        lookup[codes] = np.arange(len(codes))
+        levels.append((codes, owner, mass, com, lookup))
+
+    # 葉セルごとのノード一覧（CSR）
+    leaf_owner = levels[depth][1]
+    leaf_items = np.argsort(leaf_owner, kind='stable')
+    leaf_start = np.concatenate([[0], np.cumsum(levels[depth][2]).astype(np.int64)])
+
+    force = np.zeros_like(pos)
+    for start in range(0, n, BH_CHUNK):
+        count = min(BH_CHUNK, n - start)
+        fi = np.arange(start, start + count)
+        fc = np.zeros(count, dtype=np.int64)
+        for level in range(depth + 1):
+            codes, owner, mass, com, _ = levels[level]
+            if level == depth:
+                # 葉まで来たセルは中のノードと直接計算する
+                counts = leaf_start[fc + 1] - leaf_start[fc]
+                total = int(counts.sum())
+                run_start = np.cumsum(counts) - counts
+                j = leaf_items[np.repeat(leaf_start[fc] - run_start, counts) + np.arange(total)]
+                i = np.repeat(fi, counts)
+                other = i != j
+                i, j = i[other], j[other]
+                d = pos[i] - pos[j]
+                w = k2 / np.maximum((d ** 2).sum(axis=1), 1e-9)
+            else:
+                own = owner[fi] == fc
+                cell_size = size / (1 << level)
+                dist2 = ((com[fc] - pos[fi]) ** 2).sum(axis=1)
+                accept = ~own & (cell_size * cell_size < theta * theta * dist2)
+                i = fi[accept]
+                d = pos[i] - com[fc[accept]]
+                w = k2 * mass[fc[accept]] / np.maximum(dist2[accept], 1e-9)
+            force[start:start + count, 0] += np.bincount(i - start, d[:, 0] * w, count)
+            force[start:start + count, 1] += np.bincount(i - start, d[:, 1] * w, count)
+            if level == depth:
+                break
+            # 近すぎるセルは子セルへ展開する
+            fi, fc = fi[~accept], fc[~accept]
+            parent = codes[fc]
+            px, py = parent // (1 << level), parent % (1 << level)
+            child_side = 1 << (level + 1)
+            child_codes = np.concatenate([(2 * px + dx) * child_side + (2 * py + dy) for dx in (0, 1) for dy in (0, 1)])
+            fi = np.tile(fi, 4)
+            idx = levels[level + 1][4][child_codes]
+            exists = idx >= 0
+            fi, fc = fi[exists], idx[exists]
+    return force
+
+
+def force_layout(pos, source, target, iterations=LAYOUT_ITERATIONS, time_budget=None, theta=BH_THETA,
+                 gravity=LAYOUT_GRAVITY):
+    """Fruchterman-Reingold layout with Barnes-Hut repulsion.
+
+    Starts from ``pos`` and runs ``iterations`` steps with linear cooling,
+    with a pull towards the origin (``gravity``) that keeps disconnected
+    categories together, stopping early once ``time_budget`` seconds have
+    passed. The result is deterministic for a given start unless the time
+    budget cuts it short.
+    """
+    pos = np.array(pos, dtype=float)
+    n = len(pos)
+    if n < 2:
+        return pos
+    area = (CONTENT_MAX - CONTENT_MIN) ** 2
+    k = np.sqrt(area / n)
+    temperature = (CONTENT_MAX - CONTENT_MIN) / 10
+    # 1ノードあたりの辺が多いと塊が潰れるので、平均1本分の引力になるよう弱める
+    attraction = n / max(len(source), 1)
+    t0 = time.perf_counter()
+    for step in range(iterations):
+        force = barnes_hut_repulsion(pos, k * k, theta=theta)
+        d = pos[target] - pos[source]
+        dist = np.sqrt((d ** 2).sum(axis=1))
+        pull = d * (dist / k * attraction)[:, None]
+        for axis in (0, 1):
+            force[:, axis] += np.bincount(source, pull[:, axis], n) - np.bincount(target, pull[:, axis], n)
+        # カテゴリーの塊どうしが離れすぎないように中心へ引く
+        force -= pos * (gravity * np.sqrt(n) / k)
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-9)
+        step_size = temperature * (1 - step / iterations)
+        pos += force * (np.minimum(length, step_size) / length)[:, None]
+        if time_budget is not None and time.perf_counter() - t0 > time_budget:
+            print(f"Layout time budget reached after {step + 1} iterations")
+            break
+    return pos
+
+
+def fit_to_content(pos):
+    """Scale ``pos`` uniformly into the content square, centred."""
+    if len(pos) == 0:
+        return pos
+    lo, hi = pos.min(axis=0), pos.max(axis=0)
+    span = float(max(hi - lo)) or 1.0
+    scale = (CONTENT_MAX - CONTENT_MIN) / span
+    return (pos - (lo + hi) / 2) * scale + (CONTENT_MIN + CONTENT_MAX) / 2
+
+
+def compute_layout(nodes, mode="random", seed=LAYOUT_SEED, iterations=LAYOUT_ITERATIONS, time_budget=None):
+    """Return ``(x, y)`` for the nodes from :func:`prepare_nodes`.
+
+    ``"random"`` is the original uniform placement (same positions as
+    before for the default seed), ``"clustered"`` groups each category
+    around its own centre, and ``"force"`` relaxes the clustered start with
+    :func:`force_layout` over :func:`similarity_edges`.
+    """
+    if mode not in LAYOUT_MODES:
+        raise ValueError(f"layout must be one of {LAYOUT_MODES}, got {mode!r}")
+    switch = nodes["switch"]
+    n = len(switch)
+    if mode == "random":
+        np.random.seed(seed)
+        x = np.random.uniform(CONTENT_MIN, CONTENT_MAX, n)
+        y = np.random.uniform(CONTENT_MIN, CONTENT_MAX, n)
+        return x, y
+
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(switch, minlength=len(SWITCH_ORDER) + 1)
+    centers = cluster_centers(len(counts))
+    pos = centers[switch] + clustered_offsets(rng, counts[switch], n)
+    if mode == "force":
+        source, target = similarity_edges(switch, nodes["score"], seed=seed)
+        pos = force_layout(pos, source, target, iterations=iterations, time_budget=time_budget)
+    pos = fit_to_content(pos) if mode == "force" else np.clip(pos, CONTENT_MIN, CONTENT_MAX)
+    return pos[:, 0], pos[:, 1]
+
+
+def name_positions(names, switch=None, counts=None, mode="random"):
+    """Place nodes by a hash of their name, so a node lands in the same spot
+    no matter how many rows were added before it.
+
+    For ``"clustered"`` and ``"force"`` layouts the node is placed in its
+    category's cluster (``counts`` are the category sizes) instead of
+    uniformly.
+    """
+    x = np.empty(len(names))
+    y = np.empty(len(names))
+    if mode != "random":
+        centers = cluster_centers(len(counts))
+    for k, name in enumerate(names):
+        seed = int.from_bytes(hashlib.sha256(str(name).encode("utf-8")).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+        if mode == "random":
+            x[k], y[k] = rng.uniform(CONTENT_MIN, CONTENT_MAX, 2)
+        else:
+            x[k], y[k] = np.clip(centers[switch[k]] + clustered_offsets(rng, counts[switch[k]:switch[k] + 1], counts.sum())[0],
+                                 CONTENT_MIN, CONTENT_MAX)
+    return x, y
+
+
+def save_generation_state(path, names, x, y, switches, scores, gifts, edges, threshold, digest, layout="random"):
+    """Store what :func:`generate_animation_from_df` needs for an incremental run."""
+    empty = np.zeros(0, dtype=np.int64)
+    with atomic_output(path) as tmp_path, open(tmp_path, "wb") as f:
+        np.savez(f, version=STATE_VERSION, names=np.array(names, dtype=str), x=x, y=y,
+                 switches=np.array(switches, dtype=str), scores=np.asarray(scores, dtype=float),
+                 gifts=np.array(gifts, dtype=str),
+                 source=edges[0] if edges is not None else empty,
+                 target=edges[1] if edges is not None else empty,
+                 has_edges=edges is not None, threshold=float(threshold), digest=digest, layout=layout)
+
+
+def load_generation_state(path):
+    """Return the saved state as a dict, or ``None`` if it is missing or from another version."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        state = {key: data[key] for key in data.files}
+    if int(state.get("version", -1)) != STATE_VERSION:
+        return None
+    return state
+
+
+@contextmanager
+def atomic_output(path):
+    """Yield a temp path next to ``path`` and rename it over ``path`` on success.
+
+    Readers therefore see either the previous file or the complete new one,
+    never a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.splitext(path)[1], dir=directory)
+    os.close(fd)
+    # mkstemp は 0600 で作るので通常のファイルと同じ権限にする
+    os.chmod(tmp_path, 0o644)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_animation_binary(output_path, columns, names, palette, config):
+    """Write the columnar animation format.
+
+    Layout: ``FMAN`` magic, little-endian uint32 header length, a UTF-8 JSON
+    header, then each array 4-byte aligned. The header lists dtype, byte
+    offset and length of every array so the browser can wrap them in typed
+    arrays without copying.
+    """
+    blobs = {name: np.ascontiguousarray(arr) for name, arr in columns.items()}
+    blobs["names"] = np.frombuffer(
+        NAME_SEPARATOR.join(str(n).replace(NAME_SEPARATOR, " ") for n in names).encode("utf-8"), dtype=np.uint8)
+
+    def build_header(data_start):
+        arrays = {}
+        offset = data_start
+        for name, arr in blobs.items():
+            arrays[name] = {"dtype": arr.dtype.name, "offset": offset, "length": int(arr.size)}
+            offset += -(-arr.nbytes // 4) * 4
+        header = {"version": BINARY_VERSION, "config": config, "palette": list(palette), "arrays": arrays}
+        return json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    # ヘッダー長でオフセットが変わるため、長さが安定するまで組み直す
+    data_start = 0
+    while True:
+        header = build_header(data_start)
+        needed = -(-(8 + len(header)) // 4) * 4
+        if needed == data_start:
+            break
+        data_start = needed
+
+    with atomic_output(output_path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - 8 - len(header)))
+        for arr in blobs.values():
+            f.write(arr.tobytes())
+            f.write(b"\0" * (-arr.nbytes % 4))
+
+
+def read_animation_binary(path_or_bytes):
+    """Read a file written by :func:`write_animation_binary`.
+
+    Returns ``(header, columns, names)`` where ``columns`` maps array names to
+    NumPy views over the buffer.
+    """
+    if isinstance(path_or_bytes, (bytes, bytearray, memoryview)):
+        buf = bytes(path_or_bytes)
+    else:
+        with open(path_or_bytes, "rb") as f:
+            buf = f.read()
+    if buf[:4] != BINARY_MAGIC:
+        raise ValueError("Not an animation binary file")
+    (header_len,) = struct.unpack("<I", buf[4:8])
+    header = json.loads(buf[8:8 + header_len].decode("utf-8"))
+    columns = {}
+    for name, meta in header["arrays"].items():
+        columns[name] = np.frombuffer(buf, dtype=meta["dtype"], count=meta["length"], offset=meta["offset"])
+    names = columns.pop("names").tobytes().decode("utf-8")
+    names = names.split(NAME_SEPARATOR) if names or header["arrays"]["x"]["length"] else []
+    return header, columns, names
+
+
+def assemble_payload(fmt, path, survey=None):
+    """Build the files the browser downloads for ``fmt`` from the generated file at ``path``.
+
+    Each node gets the ``Q6_Gift`` of the ``survey`` row at the same
+    position (nodes are generated in row order; names can repeat).
+    Returns ``(files, colors, parse_sec)``: ``files`` maps the manifest field
+    (``url``, ``gifts_url``) to ``(asset name, bytes, extension)``,
+    ``colors`` are the node colours and ``parse_sec`` is the time spent
+    reading and parsing ``path``.
+    """
+    # ノードは行順に作られるので、Gift は行の位置で対応付ける（同名の回答者がいる）
+    survey_gifts = survey["Q6_Gift"].fillna("").astype(str).tolist() if survey is not None else []
+    gift_of = lambda i: survey_gifts[i] if i < len(survey_gifts) else ""
+    t0 = time.perf_counter()
+    if fmt == "binary":
+        with open(path, "rb") as f:
+            raw = f.read()
+        header, columns, names = read_animation_binary(raw)
+        parse_sec = time.perf_counter() - t0
+        colors = [header["palette"][k] for k in np.unique(columns["color"])]
+        gifts = json.dumps([gift_of(i) for i in range(len(names))], ensure_ascii=False).encode("utf-8")
+        files = {"url": ("data-binary", raw, "bin"), "gifts_url": ("gifts-binary", gifts, "json")}
+    else:
+        with open(path, "r", encoding='utf-8') as f:
+            anim_data = json.load(f)
+        parse_sec = time.perf_counter() - t0
+        for node in anim_data['nodes']:
+            node['gift'] = gift_of(node['id'])
+        colors = [n['color'] for n in anim_data['nodes']]
+        files = {"url": ("data-json", json.dumps(anim_data, ensure_ascii=False).encode("utf-8"), "json")}
+    return files, colors, parse_sec
+
+
+# --- アンケートCSVの取り込み（検証 + 型付きキャッシュ） ---
+def _validation_error(column, problem, rows):
+    shown = ", ".join(str(r) for r in rows[:5]) + (" ..." if len(rows) > 5 else "")
+    return ValueError(f"Column '{column}' {problem} (CSV rows {shown})")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ingest_survey_csv(csv_path, cache_path=SURVEY_CACHE_PATH, chunk_rows=INGEST_CHUNK_ROWS):
+    """Validate ``csv_path`` chunk by chunk and write it as a typed Feather cache.
+
+    The required columns must be present, ``Name`` and ``Q2`` must be filled
+    in and ``Q2`` must be numeric; otherwise ``ValueError`` is raised and the
+    existing cache is left untouched. ``Q2`` is stored as float64 and every
+    other column as a string (missing ``Q6_Gift`` becomes ""). The cache is
+    uncompressed Arrow IPC so :func:`load_survey` can memory-map it, and it
+    records the CSV's sha256 (see :func:`survey_cache_source`). Returns the
+    number of rows.
+    """
+    digest = file_sha256(csv_path)
+    rows = 0
+    with atomic_output(cache_path) as tmp_path:
+        writer = None
+        try:
+            # 全列を文字列で読む（チャンクごとの型推定の食い違いを避け、型はここで決める）
+            for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[""],
+                                     chunksize=chunk_rows):
+                if writer is None:
+                    missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+                    if missing:
+                        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+                # ヘッダーが1行目なので、データ行はCSV上の行番号 2 から
+                line = np.arange(rows, rows + len(chunk)) + 2
+                for column in ("Name", "Q2"):
+                    empty = chunk[column].isna().to_numpy()
+                    if empty.any():
+                        raise _validation_error(column, "has empty values", line[empty].tolist())
+                score = pd.to_numeric(chunk["Q2"], errors="coerce")
+                bad = score.isna().to_numpy()
+                if bad.any():
+                    raise _validation_error("Q2", "must be numeric", line[bad].tolist())
+                chunk["Q2"] = score.astype(np.float64)
+                chunk["Q6_Gift"] = chunk["Q6_Gift"].fillna("")
+                if writer is None:
+                    schema = pa.schema([(c, pa.float64() if c == "Q2" else pa.string()) for c in chunk.columns],
+                                       metadata={SURVEY_SOURCE_KEY: digest})
+                    writer = pa.ipc.new_file(tmp_path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+            if writer is None:
+                raise ValueError("The CSV has no header row")
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows
+
+
+def survey_cache_source(cache_path=SURVEY_CACHE_PATH):
+    """sha256 of the CSV the cache was built from, or None if there is no readable cache."""
+    try:
+        with pa.memory_map(cache_path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    value = metadata.get(SURVEY_SOURCE_KEY.encode())
+    return value.decode() if value else None
+
+
+def load_survey(path):
+    """Read survey rows from a Feather cache (memory-mapped) or, for ``.csv`` paths, the CSV itself."""
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pa.feather.read_table(path, memory_map=True).to_pandas()
+
+
+def select_label_indices(x, y, max_labels=MAX_LABELS, limit_min=-500, limit_max=500):
+    """Pick at most about ``max_labels`` nodes to label, one per grid cell.
+
+    Below the limit every node is labelled, so small datasets render exactly
+    as before.
+    """
+    num_stars = len(x)
+    if max_labels is None or num_stars <= max_labels:
+        return np.arange(num_stars)
+    if max_labels <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # 画面を max_labels 個程度のセルに分け、各セルで最初のノードだけ残す
+    cells_per_side = max(1, int(np.sqrt(max_labels)))
+    cell_size = (limit_max - limit_min) / cells_per_side
+    cx = np.clip(((np.asarray(x) - limit_min) // cell_size).astype(np.int64), 0, cells_per_side - 1)
+    cy = np.clip(((np.asarray(y) - limit_min) // cell_size).astype(np.int64), 0, cells_per_side - 1)
+    _, first = np.unique(cx * cells_per_side + cy, return_index=True)
+    return np.sort(first)
+
+
+def generate_exact_static_image(df, x, y, star_colors, scores, names, output_path='static_network_glow.png', show_lines=True, edges=None,
+                                render_mode="batched", dpi=STATIC_DPI, size_inches=STATIC_SIZE_INCHES, max_labels=MAX_LABELS):
+    """Render the glow still image.
+
+    ``render_mode="batched"`` draws edges as one LineCollection, ripples as one
+    EllipseCollection and culls labels above ``max_labels``; ``"legacy"``
+    keeps the original one-artist-per-item drawing.
+    """
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"render_mode must be one of {RENDER_MODES}, got {render_mode!r}")
     print("Generating Exact Static Image (Glow)...")
     limit_min, limit_max = -500, 500
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor='#020617')
+    fig, ax = plt.subplots(figsize=(size_inches, size_inches), facecolor='#020617')
     ax.set_facecolor('#020617')
     ax.set_xlim(limit_min, limit_max)
     ax.set_ylim(limit_min, limit_max)
@@ -30,11 +832,16 @@ def generate_exact_static_image(df, x, y, star_colors, scores, names, output_pat
     
     # Lines (Canvas: alpha=0.4, linewidth=1.0)
     if show_lines:
-        for i in range(num_stars):
-            for j in range(i + 1, num_stars):
-                dist = np.sqrt((x[i]-x[j])**2 + (y[i]-y[j])**2)
-                if dist < 160:
-                    ax.plot([x[i], x[j]], [y[i], y[j]], color="#fff7d6", alpha=0.4, linewidth=1.0, zorder=1)
+        if edges is None:
+            edges = build_edges(x, y, np.zeros(num_stars, dtype=int))
+        source, target = edges[0], edges[1]
+        if render_mode == "batched":
+            segments = np.stack([np.column_stack([x[source], y[source]]),
+                                 np.column_stack([x[target], y[target]])], axis=1)
+            ax.add_collection(LineCollection(segments, colors="#fff7d6", alpha=0.4, linewidths=1.0, zorder=1), autolim=False)
+        else:
+            for i, j in zip(source, target):
+                ax.plot([x[i], x[j]], [y[i], y[j]], color="#fff7d6", alpha=0.4, linewidth=1.0, zorder=1)
 
     # Ripples & Nodes (Canvas Style)
     bg_circle_size_outer = (80/1000 * 10 * 72)**2 / 4 # Approximate sizing logic
@@ -49,12 +856,19 @@ def generate_exact_static_image(df, x, y, star_colors, scores, names, output_pat
     s_inner = 1200 # 0.7 radius -> 0.49 area
     s_core = 30
     
-    for i in range(num_stars):
-        # Ripple: Solid ring, Canvas col, alpha 0.5, linewidth 2.5
-        # Radius ratio 1/2 of previous (4.5 -> 2.25)
-        r_size = scores[i] * 2.25
-        circle = patches.Circle((x[i], y[i]), r_size, edgecolor=star_colors[i], facecolor='none', alpha=0.5, linewidth=2.5, zorder=2)
-        ax.add_patch(circle)
+    # Ripple: Solid ring, Canvas col, alpha 0.5, linewidth 2.5
+    # Radius ratio 1/2 of previous (4.5 -> 2.25)
+    if render_mode == "batched":
+        diameters = np.asarray(scores, dtype=float) * 2.25 * 2
+        ripples = EllipseCollection(diameters, diameters, np.zeros(num_stars), units='xy',
+                                    offsets=np.column_stack([x, y]), offset_transform=ax.transData,
+                                    edgecolors=star_colors, facecolors='none', alpha=0.5, linewidths=2.5, zorder=2)
+        ax.add_collection(ripples, autolim=False)
+    else:
+        for i in range(num_stars):
+            r_size = scores[i] * 2.25
+            circle = patches.Circle((x[i], y[i]), r_size, edgecolor=star_colors[i], facecolor='none', alpha=0.5, linewidth=2.5, zorder=2)
+            ax.add_patch(circle)
     
     # Batch scatter for glow (efficiency and blending)
     # Canvas: Outer Alpha 0.075
@@ -65,111 +879,427 @@ def generate_exact_static_image(df, x, y, star_colors, scores, names, output_pat
     ax.scatter(x, y, s=s_core, c="#ffffff", alpha=0.9, edgecolors='none', zorder=5)
     
     # Names
-    for i in range(num_stars):
+    if render_mode == "batched":
+        label_indices = select_label_indices(x, y, max_labels=max_labels, limit_min=limit_min, limit_max=limit_max)
+    else:
+        label_indices = range(num_stars)
+    for i in label_indices:
          ax.text(x[i]+5, y[i]-5, names[i], color="#fff7d6", fontsize=7, fontweight='bold', alpha=0.9, zorder=6)
 
-    plt.savefig(output_path, dpi=300, bbox_inches='tight', pad_inches=0)
+    with atomic_output(output_path) as tmp_path:
+        plt.savefig(tmp_path, format='png', dpi=dpi, bbox_inches='tight', pad_inches=0)
     plt.close(fig)
     print(f"Exact static image exported to {output_path}")
 
-def generate_animation_from_df(df, output_path='animation_data.json', show_lines=True):
-    # 設定
-    num_stars = len(df)
-    names = df['Name'].tolist()
+def generate_animation_from_df(df, output_path='animation_data.json', show_lines=True, threshold=EDGE_THRESHOLD,
+                               render_mode="batched", dpi=STATIC_DPI, size_inches=STATIC_SIZE_INCHES,
+                               output_format="both", binary_path='animation_data.bin',
+                               static_path='static_network_glow.png', progress=None,
+                               incremental=False, state_path='animation_state.npz', stats=None, trace_memory=False,
+                               layout="random", layout_iterations=LAYOUT_ITERATIONS, layout_time_budget=None):
+    """Generate animation data and the static image from a survey DataFrame.
+
+    ``progress`` is called with each stage name from ``JOB_STAGES`` as the
+    generation advances.
+
+    With ``incremental=True`` the previous run's state (``state_path``) is
+    matched by ``Name`` and answers (see :func:`match_previous_nodes`):
+    existing respondents keep their positions and edges, only new
+    respondents are placed (by a hash of name and answers) and searched for
+    neighbours, and the outputs are left untouched when nothing changed.
+
+    ``layout`` picks the placement from ``LAYOUT_MODES`` (see
+    :func:`compute_layout`); ``layout_iterations`` and ``layout_time_budget``
+    bound the force-directed mode.
+
+    If ``stats`` is a dict, the time of each measured stage is recorded in
+    it (``prep_sec``, ``layout_sec``, ``edges_sec``, ``binary_sec``,
+    ``json_sec``, ``png_sec``), plus its peak traced memory
+    (``*_peak_bytes``) with ``trace_memory=True``.
+    """
+    if progress is None:
+        progress = lambda stage: None
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format!r}")
+    if layout not in LAYOUT_MODES:
+        raise ValueError(f"layout must be one of {LAYOUT_MODES}, got {layout!r}")
+    progress("layout")
+    with measure_stage(stats, "prep", trace_memory):
+        nodes = prepare_nodes(df)
+        num_stars = len(df)
+        names = nodes["names"]
+        scores = nodes["score"]
+        appearance_delay = nodes["delay"]
+        star_colors = np.array(PALETTE)[nodes["color"]]
+
+        switches = np.array(SWITCH_ORDER + ("",))[nodes["switch"]]
+        gifts = df['Q6_Gift'].fillna("").astype(str).to_numpy(dtype=str)
+
+    with measure_stage(stats, "layout", trace_memory):
+        state = load_generation_state(state_path) if incremental else None
+        if state is not None and str(state.get("layout", "random")) != layout:
+            print(f"Layout changed to {layout}; rebuilding all positions")
+            state = None
+
+        prev = None
+        if state is not None:
+            # 名前と回答で前回のノードと対応付ける（-1 は新規）
+            keys = answer_keys(names, scores, switches, gifts)
+            prev = match_previous_nodes(keys, names, scores, switches, gifts, state)
+            is_new = prev < 0
+            kept = ~is_new
+            x = np.empty(num_stars)
+            y = np.empty(num_stars)
+            x[kept], y[kept] = state["x"][prev[kept]], state["y"][prev[kept]]
+            counts = np.bincount(nodes["switch"], minlength=len(SWITCH_ORDER) + 1)
+            x[is_new], y[is_new] = name_positions(keys[is_new], nodes["switch"][is_new], counts, mode=layout)
+            changed = kept.copy()
+            changed[kept] = ((state["switches"][prev[kept]] != switches[kept]) |
+                             (state["scores"][prev[kept]] != scores[kept]) |
+                             (state["gifts"][prev[kept]] != gifts[kept]))
+            removed = len(state["names"]) - int(kept.sum())
+            print(f"Incremental update: {int(is_new.sum())} added, {int(changed.sum())} changed, {removed} removed")
+        else:
+            x, y = compute_layout(nodes, mode=layout, iterations=layout_iterations, time_budget=layout_time_budget)
 
-    # 色設定
-    color_map = {
-        "安心": "#0ea5e9", "挑戦": "#f97316", "確信": "#eab308", 
-        "充足": "#4ade80", "静観": "#ffffff"
-    }
-    
-    star_colors = [color_map.get(s, "#ffffff") for s in df['Q4_Switch']]
-    scores = df['Q2'].values
-
-    np.random.seed(42)
-    # Background -500 to 500. Content -400 to 400.
-    content_min, content_max = -400, 400
-    x = np.random.uniform(content_min, content_max, num_stars)
-    y = np.random.uniform(content_min, content_max, num_stars)
-    
-    # スピード設定
-    # Order: ["安心", "挑戦", "確信", "充足", "静観"]
-    # Secondary: Q2 (Ascending)
-    order_map = {"安心": 0, "挑戦": 1, "確信": 2, "充足": 3, "静観": 4}
-    
-    # Create temporary sort columns
-    df['sort_primary'] = df['Q4_Switch'].map(lambda x: order_map.get(x, 5))
-    df['sort_secondary'] = df['Q2']
-    
-    # Sort
-    df_sorted = df.sort_values(by=['sort_primary', 'sort_secondary'], ascending=[True, True])
-    
-    # Assign delays based on rank
-    # Spread over 0 to ~2800 frames (leaving 1200 frames for tail in 4000 frame duration)
-    # len(df) is roughly 100. Step ~28.
-    df_sorted['delay_val'] = np.arange(len(df)) * 28
-    
-    appearance_delay = np.zeros(num_stars)
-    for idx, row in df_sorted.iterrows():
-        appearance_delay[idx] = int(row['delay_val'])
-    
-    appearance_delay = appearance_delay.astype(int).tolist()
-    
     # Network Lines
-    lines_data = []
-    if show_lines:
-        for i in range(num_stars):
-            for j in range(i + 1, num_stars):
-                dist = np.sqrt((x[i]-x[j])**2 + (y[i]-y[j])**2)
-                # Threshold 160
-                if dist < 160:
-                    lines_data.append({
-                        "source": i,
-                        "target": j,
-                        "delay": max(appearance_delay[i], appearance_delay[j])
-                    })
-
-    # Prepare Data
-    nodes_data = []
-    for i in range(num_stars):
-        nodes_data.append({
-            "id": i,
-            "x": float(x[i]),
-            "y": float(y[i]),
-            "name": names[i],
-            "color": star_colors[i],
-            "score": float(scores[i]),
-            "delay": appearance_delay[i]
-        })
-
-    data = {
-        "nodes": nodes_data,
-        "lines": lines_data,
-        "config": {
-            "limit_min": -500,
-            "limit_max": 500,
-            "duration_frames": 4000,
-            "fps": 20
+    # 近傍探索は一度だけ行い、JSONと静止画の両方で使い回す
+    progress("edges")
+    with measure_stage(stats, "edges", trace_memory):
+        edges = None
+        if show_lines and prev is not None and bool(state["has_edges"]) and float(state["threshold"]) == threshold:
+            # 位置は変わらないので、残ったノード同士の線はそのまま使える
+            new_index = np.full(len(state["names"]), -1, dtype=np.int64)
+            new_index[prev[kept]] = np.flatnonzero(kept)
+            s_old, t_old = new_index[state["source"]], new_index[state["target"]]
+            survived = (s_old >= 0) & (t_old >= 0)
+            s_old, t_old = s_old[survived], t_old[survived]
+            s_new, t_new = build_edges_for(x, y, np.flatnonzero(is_new), threshold=threshold)
+            source = np.concatenate([np.minimum(s_old, t_old), s_new])
+            target = np.concatenate([np.maximum(s_old, t_old), t_new])
+            sort_idx = np.lexsort((target, source))
+            source, target = source[sort_idx], target[sort_idx]
+            edges = (source, target, np.maximum(appearance_delay[source], appearance_delay[target]))
+        elif show_lines:
+            edges = build_edges(x, y, appearance_delay, threshold=threshold)
+
+    # 出力に効く内容が前回と同じなら書き直さない
+    digest = hashlib.sha256()
+    for part in (x, y, scores, appearance_delay, nodes["color"]):
+        digest.update(np.ascontiguousarray(part).tobytes())
+    digest.update(json.dumps([names, show_lines, render_mode, dpi, size_inches, output_format,
+                              output_path, binary_path, static_path], ensure_ascii=False, default=str).encode("utf-8"))
+    if edges is not None:
+        for part in edges:
+            digest.update(np.ascontiguousarray(part, dtype=np.int64).tobytes())
+    digest = digest.hexdigest()
+    outputs = [static_path]
+    if output_format in ("both", "binary"):
+        outputs.append(binary_path)
+    if output_format in ("both", "json"):
+        outputs.append(output_path)
+    if state is not None and str(state["digest"]) == digest and all(os.path.exists(p) for p in outputs):
+        print("No changes since the last generation; outputs left as they are")
+        progress("done")
+        return
+
+    progress("json")
+    if output_format in ("both", "binary"):
+        with measure_stage(stats, "binary", trace_memory):
+            empty = np.zeros(0, dtype=np.int32)
+            columns = {
+                "x": x.astype(np.float32),
+                "y": y.astype(np.float32),
+                "score": scores.astype(np.float32),
+                "delay": appearance_delay.astype(np.int32),
+                "color": nodes["color"].astype(np.int32),
+                "source": edges[0].astype(np.int32) if edges is not None else empty,
+                "target": edges[1].astype(np.int32) if edges is not None else empty,
+                "line_delay": edges[2].astype(np.int32) if edges is not None else empty,
+            }
+            write_animation_binary(binary_path, columns, names, PALETTE, ANIMATION_CONFIG)
+            print(f"Binary data exported to {binary_path} ({os.path.getsize(binary_path):,} bytes)")
+
+    if output_format in ("both", "json"):
+        with measure_stage(stats, "json", trace_memory):
+            # JSON は同じ列のシリアライズ（互換用）
+            lines_data = []
+            if edges is not None:
+                lines_data = [
+                    {"source": i, "target": j, "delay": d}
+                    for i, j, d in zip(*(part.tolist() for part in edges))
+                ]
+            nodes_data = [
+                {"id": i, "x": xi, "y": yi, "name": name, "color": color, "score": score, "delay": delay}
+                for i, xi, yi, name, color, score, delay in zip(
+                    range(num_stars), x.tolist(), y.tolist(), names, star_colors.tolist(), scores.tolist(),
+                    appearance_delay.tolist())
+            ]
+
+            data = {
+                "nodes": nodes_data,
+                "lines": lines_data,
+                "config": dict(ANIMATION_CONFIG)
+            }
+
+            with atomic_output(output_path) as tmp_path, open(tmp_path, "w", encoding='utf-8') as f:
+                # json.dump やインデント付きは純Pythonのエンコーダーになり大規模データで遅いので、
+                # Cエンコーダーが使われる dumps で詰めて書く
+                f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+            print(f"Data exported to {output_path} ({os.path.getsize(output_path):,} bytes)")
+
+    # Generate Exact Static Image (Glow)
+    progress("png")
+    with measure_stage(stats, "png", trace_memory):
+        generate_exact_static_image(df, x, y, star_colors, scores, names, output_path=static_path, show_lines=show_lines,
+                                    edges=edges, render_mode=render_mode, dpi=dpi, size_inches=size_inches)
+    save_generation_state(state_path, names, x, y, switches, scores, gifts, edges, threshold, digest, layout)
+    progress("done")
+
+
+# --- フレーム連番 / 動画の書き出し（プロセスプール用） ---
+_frame_worker = None
+
+
+def load_animation_timeline(path):
+    """Load the columns of an animation binary or JSON file for frame export.
+
+    Returns a dict with NumPy arrays ``x``, ``y``, ``score``, ``delay``,
+    ``source``, ``target`` and ``line_delay``, plus ``colors`` (hex string
+    per node), ``names`` and ``config``.
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        nodes = pd.DataFrame(data["nodes"], columns=["x", "y", "name", "color", "score", "delay"])
+        lines = pd.DataFrame(data["lines"], columns=["source", "target", "delay"])
+        return {
+            "x": nodes["x"].to_numpy(np.float64), "y": nodes["y"].to_numpy(np.float64),
+            "score": nodes["score"].to_numpy(np.float64), "delay": nodes["delay"].to_numpy(np.int64),
+            "source": lines["source"].to_numpy(np.int64), "target": lines["target"].to_numpy(np.int64),
+            "line_delay": lines["delay"].to_numpy(np.int64),
+            "colors": nodes["color"].tolist(), "names": nodes["name"].tolist(), "config": data["config"],
         }
+    header, columns, names = read_animation_binary(path)
+    palette = header["palette"]
+    timeline = {key: columns[key].astype(np.int64 if key in ("delay", "source", "target", "line_delay") else np.float64)
+                for key in ("x", "y", "score", "delay", "source", "target", "line_delay")}
+    timeline.update(colors=[palette[c] for c in columns["color"].tolist()], names=names, config=header["config"])
+    return timeline
+
+
+def init_frame_worker(timeline, background_path, size, supersample=1):
+    """Process-pool initializer: project the nodes and pre-render the background once per worker."""
+    global _frame_worker
+    width, height = size[0] * supersample, size[1] * supersample
+    # canvas 座標（800x600）→ 描画ピクセル
+    k = width / CANVAS_SIZE[0]
+    px = (100 + ((timeline["x"] + 500) / 1000) * 600) * k
+    py = (600 * (1 - (timeline["y"] + 500) / 1000)) * height / CANVAS_SIZE[1]
+    node_order = np.argsort(timeline["delay"], kind="stable")
+    line_order = np.argsort(timeline["line_delay"], kind="stable")
+    background = Image.open(background_path).convert("RGB").resize((width, height), Image.LANCZOS)
+    font_path = font_manager.findfont(font_manager.FontProperties(family=plt.rcParams['font.family'], weight='bold'))
+    _frame_worker = {
+        "size": size, "k": k, "background": background,
+        "font": ImageFont.truetype(font_path, max(1, round(9 * k))),
+        "node_order": node_order, "node_delay": timeline["delay"][node_order],
+        "px": px, "py": py, "score": timeline["score"], "delay": timeline["delay"], "names": timeline["names"],
+        "rgb": [tuple(int(c[i:i + 2], 16) for i in (1, 3, 5)) for c in timeline["colors"]],
+        "line_source": timeline["source"][line_order], "line_target": timeline["target"][line_order],
+        "line_delay": timeline["line_delay"][line_order],
+        "labels": len(node_order) <= LABEL_BUDGET,
     }
-    
-    with open(output_path, "w", encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    print(f"Data exported to {output_path}")
 
-    # Generate Exact Static Image (Glow)
-    generate_exact_static_image(df, x, y, star_colors, scores, names, output_path='static_network_glow.png', show_lines=show_lines)
+
+def _alpha(a):
+    return int(round(min(1.0, max(0.0, a)) * 255))
+
+
+def _draw_lines(draw, lo, hi, elapsed=None):
+    # elapsed=None は焼き込み（EDGE_ALPHA で固定）
+    w = _frame_worker
+    width = max(1, round(w["k"]))
+    for e in range(lo, hi):
+        a = EDGE_ALPHA if elapsed is None else min(EDGE_ALPHA, (elapsed - w["line_delay"][e]) / EDGE_FADE)
+        s, t = w["line_source"][e], w["line_target"][e]
+        draw.line([(w["px"][s], w["py"][s]), (w["px"][t], w["py"][t])], fill=(255, 255, 255, _alpha(a)), width=width)
+
+
+def _draw_nodes(draw, elapsed):
+    # canvas_renderer.js の immediate モードと同じ順（ノードごとに波紋 → 光彩 → 名前）
+    w = _frame_worker
+    k = w["k"]
+    ring = max(1, round(3 * k))
+    end = np.searchsorted(w["node_delay"], elapsed, "right")
+    for i in w["node_order"][:end].tolist():
+        x, y, age = w["px"][i], w["py"][i], elapsed - w["delay"][i]
+        a = min(1, age / NODE_FADE)
+        p = (age % RIPPLE_PERIOD) / RIPPLE_PERIOD
+        r = (p * (w["score"][i] * 4.5) / 1000) * 600 * k + ring / 2
+        draw.ellipse([x - r, y - r, x + r, y + r], outline=w["rgb"][i] + (_alpha(1.2 * (1 - p)),), width=ring)
+        for radius, alpha in GLOW_RINGS:
+            draw.ellipse([x - radius * k, y - radius * k, x + radius * k, y + radius * k],
+                         fill=(255, 255, 255, _alpha(a * alpha)))
+        if w["labels"]:
+            draw.text((x + 8 * k, y - 5 * k), w["names"][i], font=w["font"], fill=(255, 255, 255, _alpha(a * 0.7)),
+                      anchor="ls")
+
+
+def render_frame_range(out_dir, first_index, frames):
+    """Pool task: render the elapsed values ``frames`` (ascending) as ``frame_{index:06d}.png``.
+
+    Lines stop changing once they reach ``EDGE_ALPHA``; they are baked into a
+    copy of the worker's background as the range advances, so each frame only
+    draws the lines still fading in and the nodes.
+    """
+    w = _frame_worker
+    base = w["background"].copy()
+    base_draw = ImageDraw.Draw(base, "RGBA")
+    settled = 0
+    for offset, elapsed in enumerate(frames):
+        now_settled = np.searchsorted(w["line_delay"], elapsed - EDGE_SETTLE, "right")
+        _draw_lines(base_draw, settled, now_settled)
+        settled = now_settled
+        frame = base.copy()
+        draw = ImageDraw.Draw(frame, "RGBA")
+        _draw_lines(draw, settled, np.searchsorted(w["line_delay"], elapsed, "right"), elapsed)
+        _draw_nodes(draw, elapsed)
+        if frame.size != tuple(w["size"]):
+            frame = frame.resize(w["size"], Image.LANCZOS)
+        # 連番は途中で止めても使えるように都度書き、圧縮は速さ優先
+        frame.save(os.path.join(out_dir, f"frame_{first_index + offset:06d}.png"), compress_level=1)
+    return len(frames)
+
+
+def export_frames(data_path, out_dir, background_path="universe_bg.png", stride=1, width=CANVAS_SIZE[0],
+                  supersample=1, workers=None, video_path=None, stats=None):
+    """Render the animation timeline to a PNG sequence in ``out_dir``.
+
+    Frame ``i`` shows elapsed ``i * stride`` of the browser timeline (20 per
+    second) up to ``duration_frames``. Contiguous frame ranges are split over
+    ``workers`` processes (default: all cores). When ``video_path`` is given
+    and ``ffmpeg`` is on PATH, the sequence is also encoded at real-time
+    speed. Returns a summary dict.
+    """
+    timeline = load_animation_timeline(data_path)
+    config = timeline["config"]
+    # 動画エンコーダーは偶数サイズを要求するので 4:3 を保ったまま偶数に丸める
+    width = max(2, int(width) // 2 * 2)
+    size = (width, max(2, round(width * CANVAS_SIZE[1] / CANVAS_SIZE[0] / 2) * 2))
+    frames = np.arange(0, config["duration_frames"], stride)
+    workers = workers or os.cpu_count() or 1
+
+    os.makedirs(out_dir, exist_ok=True)
+    # 前回の長い連番が残っていると動画に混ざる
+    for name in os.listdir(out_dir):
+        if name.startswith("frame_") and name.endswith(".png"):
+            os.remove(os.path.join(out_dir, name))
+
+    chunks = [c for c in np.array_split(frames, min(len(frames), workers * EXPORT_TASKS_PER_WORKER)) if len(c)]
+    starts = np.cumsum([0] + [len(c) for c in chunks[:-1]])
+    initargs = (timeline, background_path, size, supersample)
+    t0 = time.perf_counter()
+    with measure_stage(stats, "frames"):
+        if workers == 1:
+            init_frame_worker(*initargs)
+            for start, chunk in zip(starts, chunks):
+                render_frame_range(out_dir, int(start), chunk.tolist())
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_frame_worker, initargs=initargs) as pool:
+                list(pool.map(render_frame_range, [out_dir] * len(chunks), starts.tolist(),
+                              [c.tolist() for c in chunks]))
+    seconds = time.perf_counter() - t0
+    print(f"Rendered {len(frames):,} frames at {size[0]}x{size[1]} to {out_dir} "
+          f"in {seconds:.1f}s ({len(frames) / max(seconds, 1e-9):.1f} frames/s, {workers} workers)")
+
+    video = None
+    if video_path:
+        encoder = shutil.which("ffmpeg")
+        if encoder is None:
+            print("ffmpeg not found; kept the PNG sequence only")
+        else:
+            with measure_stage(stats, "video"), atomic_output(video_path) as tmp_path:
+                subprocess.run([encoder, "-y", "-loglevel", "error", "-framerate", str(config["fps"] / stride),
+                                "-i", os.path.join(out_dir, "frame_%06d.png"), "-pix_fmt", "yuv420p", tmp_path],
+                               check=True)
+            video = video_path
+            print(f"Video encoded to {video_path} ({os.path.getsize(video_path):,} bytes)")
+    return {"frames": len(frames), "size": size, "seconds": seconds, "workers": workers, "video": video}
+
+
+# --- バックグラウンド生成ジョブ（プロセスプール用） ---
+_job_progress_queue = None
+
+
+def init_job_worker(progress_queue):
+    """Process-pool initializer: remember the queue used to report progress."""
+    global _job_progress_queue
+    _job_progress_queue = progress_queue
+    plt.switch_backend('Agg')
+
+
+def run_generation_job(job_id, csv_path='survey_data.csv', **options):
+    """Entry point for a pool worker: read ``csv_path`` (CSV or Feather cache) and generate all outputs.
+
+    Progress is reported as ``(job_id, stage)`` tuples on the queue given to
+    :func:`init_job_worker`.
+    """
+    def report(stage):
+        if _job_progress_queue is not None:
+            _job_progress_queue.put((job_id, stage))
+
+    with measure_stage(options.get("stats"), "survey_load", options.get("trace_memory", False)):
+        df = load_survey(csv_path)
+    generate_animation_from_df(df, progress=report, **options)
+    return job_id
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--no-lines', action='store_true', help='Disable network lines')
+    parser.add_argument('--threshold', type=float, default=EDGE_THRESHOLD, help='Max distance for network lines')
+    parser.add_argument('--render-mode', choices=RENDER_MODES, default="batched", help='Static image rendering mode')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default="both", help='Animation data output format')
+    parser.add_argument('--dpi', type=int, default=STATIC_DPI, help='Static image DPI')
+    parser.add_argument('--size', type=float, default=STATIC_SIZE_INCHES, help='Static image size in inches')
+    parser.add_argument('--incremental', action='store_true', help='Reuse positions and edges from the last run, matched by Name and answers')
+    parser.add_argument('--layout', choices=LAYOUT_MODES, default="random", help='Node placement')
+    parser.add_argument('--layout-iterations', type=int, default=LAYOUT_ITERATIONS, help='Force layout iterations')
+    parser.add_argument('--layout-time', type=float, default=None, help='Force layout time budget in seconds')
+    parser.add_argument('--stats', action='store_true', help='Print stage timings')
+    parser.add_argument('--trace-memory', action='store_true', help='Also trace peak memory per stage (slower)')
+    parser.add_argument('--export-frames', metavar='DIR', help='Render the animation timeline to a PNG sequence in DIR instead of generating')
+    parser.add_argument('--export-source', default=None, help='Animation data to export (default: animation_data.bin, else animation_data.json)')
+    parser.add_argument('--frame-stride', type=int, default=1, help='Render every Nth timeline frame')
+    parser.add_argument('--frame-width', type=int, default=CANVAS_SIZE[0], help='Exported frame width in pixels (4:3)')
+    parser.add_argument('--supersample', type=int, default=1, help='Render frames at N times the size and downscale (smoother edges)')
+    parser.add_argument('--workers', type=int, default=None, help='Frame export processes (default: all cores)')
+    parser.add_argument('--video', default=None, help='Also encode the frames to this video file when ffmpeg is available')
     args = parser.parse_args()
     
+    if args.export_frames:
+        source = args.export_source or ("animation_data.bin" if os.path.exists("animation_data.bin") else "animation_data.json")
+        export_frames(source, args.export_frames, stride=args.frame_stride, width=args.frame_width,
+                      supersample=args.supersample, workers=args.workers, video_path=args.video)
+        raise SystemExit(0)
+
     try:
-        df = pd.read_csv("survey_data.csv")
-        generate_animation_from_df(df, show_lines=not args.no_lines)
+        stats = {} if args.stats or args.trace_memory else None
+        # アプリと同じ検証を通し、CSVが変わっていなければ前回のキャッシュを使う
+        if survey_cache_source(SURVEY_CACHE_PATH) != file_sha256("survey_data.csv"):
+            with measure_stage(stats, "csv_parse", args.trace_memory):
+                ingest_survey_csv("survey_data.csv", SURVEY_CACHE_PATH)
+        with measure_stage(stats, "survey_load", args.trace_memory):
+            df = load_survey(SURVEY_CACHE_PATH)
+        generate_animation_from_df(df, show_lines=not args.no_lines, threshold=args.threshold,
+                                   render_mode=args.render_mode, dpi=args.dpi, size_inches=args.size,
+                                   output_format=args.format, incremental=args.incremental,
+                                   stats=stats, trace_memory=args.trace_memory, layout=args.layout,
+                                   layout_iterations=args.layout_iterations, layout_time_budget=args.layout_time)
+        if stats is not None:
+            print(format_stats(stats))
         print("Done.")
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,82 @@
+"""build_edges must give exactly the edges of the original nested loop."""
+import numpy as np
+import pytest
+
+from gen_animation import EDGE_THRESHOLD, build_edges
+
+
+def loop_edges(x, y, appearance_delay, threshold=EDGE_THRESHOLD):
+    # 置き換え前の generate_animation_from_df の for i / for j ループそのまま
+    source, target, delay = [], [], []
+    num_stars = len(x)
+    for i in range(num_stars):
+        for j in range(i + 1, num_stars):
+            dist = np.sqrt((x[i]-x[j])**2 + (y[i]-y[j])**2)
+            if dist < threshold:
+                source.append(i)
+                target.append(j)
+                delay.append(max(appearance_delay[i], appearance_delay[j]))
+    return source, target, delay
+
+
+def assert_same_edges(x, y, delay, threshold=EDGE_THRESHOLD):
+    expected = loop_edges(x, y, delay, threshold)
+    actual = build_edges(x, y, delay, threshold=threshold)
+    for want, got in zip(expected, actual):
+        assert got.tolist() == want
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_points(seed):
+    rng = np.random.default_rng(seed)
+    n = 300
+    x = rng.uniform(-500, 500, n)
+    y = rng.uniform(-500, 500, n)
+    delay = rng.permutation(n) * 28
+    assert_same_edges(x, y, delay)
+
+
+@pytest.mark.parametrize("threshold", [1e-6, 0.01, 1, 37.5, 160, 400, 2000])
+def test_thresholds(threshold):
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-500, 500, 200)
+    y = rng.uniform(-500, 500, 200)
+    assert_same_edges(x, y, np.arange(200) * 28, threshold)
+
+
+def test_duplicate_points():
+    x = np.array([0.0, 0.0, 0.0, 10.0, 10.0, 500.0, 500.0])
+    y = np.array([0.0, 0.0, 0.0, 10.0, 10.0, -500.0, -500.0])
+    assert_same_edges(x, y, [56, 0, 28, 84, 112, 140, 168])
+
+
+def test_pairs_exactly_at_threshold():
+    # 3-4-5 の直角三角形で距離がちょうど 160 になる点と、セル境界をまたぐ点
+    x = np.array([0.0, 160.0, 96.0, 0.0, -160.0, 159.999, 320.0])
+    y = np.array([0.0, 0.0, 128.0, 160.0, 0.0, 0.0, 0.0])
+    assert_same_edges(x, y, np.arange(7) * 28)
+    source, target, _ = build_edges(x, y, np.arange(7) * 28)
+    assert (0, 1) not in zip(source.tolist(), target.tolist())
+
+
+def test_integer_grid_points():
+    # 格子状に並ぶと多くのペアがちょうど閾値上に乗る
+    gx, gy = np.meshgrid(np.arange(-4, 5) * 80.0, np.arange(-4, 5) * 96.0)
+    x, y = gx.ravel(), gy.ravel()
+    assert_same_edges(x, y, np.arange(len(x))[::-1] * 28)
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_fewer_than_two_nodes(n):
+    source, target, delay = build_edges(np.zeros(n), np.zeros(n), np.zeros(n, dtype=int))
+    assert len(source) == len(target) == len(delay) == 0
+    assert_same_edges(np.zeros(n), np.zeros(n), np.zeros(n, dtype=int))
+
+
+def test_small_threshold_with_near_duplicates():
+    # 閾値が小さくてもセル数ぶんのメモリは確保しない
+    rng = np.random.default_rng(2)
+    x = np.round(rng.uniform(-500, 500, 100), 1)
+    y = np.round(rng.uniform(-500, 500, 100), 1)
+    x[50:60], y[50:60] = x[:10] + 0.001, y[:10]
+    assert_same_edges(x, y, np.arange(100) * 28, threshold=0.01)
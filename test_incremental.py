@@ -0,0 +1,96 @@
+"""Incremental regeneration must keep respondents on their nodes and give the edges of a full search."""
+import contextlib
+import io
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gen_animation import build_edges, generate_animation_from_df, load_generation_state, prepare_nodes, read_animation_binary
+
+SURVEY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "survey_data.csv")
+
+
+def generate(df, workdir):
+    paths = {
+        "output_path": os.path.join(workdir, "animation_data.json"),
+        "binary_path": os.path.join(workdir, "animation_data.bin"),
+        "static_path": os.path.join(workdir, "static_network_glow.png"),
+        "state_path": os.path.join(workdir, "animation_state.npz"),
+    }
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        # 日本語フォントのない環境ではラベルごとに警告が出る
+        warnings.simplefilter("ignore")
+        generate_animation_from_df(df, incremental=True, dpi=20, **paths)
+    return load_generation_state(paths["state_path"]), read_animation_binary(paths["binary_path"])
+
+
+def positions(state):
+    return np.column_stack([state["x"], state["y"]])
+
+
+@pytest.fixture
+def survey():
+    df = pd.read_csv(SURVEY_CSV)
+    df["Q2"] = df["Q2"].astype(float)
+    return df
+
+
+def test_append_edit_delete_keeps_positions_and_matches_full_search(survey, tmp_path):
+    before, _ = generate(survey, tmp_path)
+    old_pos = positions(before)
+
+    # 4人いる小川さんの1人目を消し、別の同名の回答者の Q2 を編集し、行を並べ替えて3行追加する
+    ogawa = np.flatnonzero(survey["Name"] == "小川さん")
+    tanaka = np.flatnonzero(survey["Name"] == "田中さん")
+    df = survey.copy()
+    df.loc[tanaka[1], "Q2"] = 1.0
+    origin = np.delete(np.arange(len(survey)), ogawa[0])
+    origin = np.concatenate([origin[10:], origin[:10]])
+    df = df.iloc[origin].reset_index(drop=True)
+    added = pd.DataFrame({
+        "Name": ["長谷川さん", "新規さん", "田中さん"],
+        "Q2": [5.0, 10.0, 3.0],
+        "Q4_Switch": ["挑戦", "安心", "静観"],
+        "Q5": [1, 2, 3],
+        "Q6_Gift": ["追加1", "追加2", "追加3"],
+    })
+    df = pd.concat([df, added], ignore_index=True)
+
+    after, (_, columns, names) = generate(df, tmp_path)
+    new_pos = positions(after)
+
+    # 残った回答者は（同名の人も含めて）それぞれ元の位置のまま、追加した行は新しい位置
+    np.testing.assert_array_equal(new_pos[:len(origin)], old_pos[origin])
+    assert not {tuple(p) for p in new_pos[len(origin):]} & {tuple(p) for p in old_pos}
+    assert tuple(old_pos[ogawa[0]]) not in {tuple(p) for p in new_pos}
+    assert names == df["Name"].tolist()
+
+    # 線は同じ位置で全ペアを探したときと同じ
+    source, target, delay = build_edges(after["x"], after["y"], prepare_nodes(df)["delay"])
+    np.testing.assert_array_equal(columns["source"], source)
+    np.testing.assert_array_equal(columns["target"], target)
+    np.testing.assert_array_equal(columns["line_delay"], delay)
+    np.testing.assert_array_equal(after["source"], source)
+    np.testing.assert_array_equal(after["target"], target)
+
+
+def test_reordered_same_name_rows_keep_their_nodes(survey, tmp_path):
+    before, _ = generate(survey, tmp_path)
+    old_pos = positions(before)
+
+    # 同名の回答者の行順を入れ替え、そのうち1人の Q4_Switch も変える
+    nagase = np.flatnonzero(survey["Name"] == "長谷川さん")
+    origin = np.arange(len(survey))
+    origin[nagase] = nagase[::-1]
+    df = survey.iloc[origin].reset_index(drop=True)
+    df.loc[nagase[0], "Q4_Switch"] = "充足" if df.loc[nagase[0], "Q4_Switch"] != "充足" else "安心"
+
+    after, (_, columns, _) = generate(df, tmp_path)
+    np.testing.assert_array_equal(positions(after), old_pos[origin])
+    source, target, delay = build_edges(after["x"], after["y"], prepare_nodes(df)["delay"])
+    np.testing.assert_array_equal(columns["source"], source)
+    np.testing.assert_array_equal(columns["target"], target)
+    np.testing.assert_array_equal(columns["line_delay"], delay)